@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import jwt, JWTError
 from models import TokenData
 import os
@@ -19,6 +19,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str, credentials_exception):
+    return verify_token_with_expiry(token, credentials_exception)[0]
+
+def verify_token_with_expiry(token: str, credentials_exception) -> Tuple[TokenData, Optional[int]]:
+    # Also returns the token's `exp` claim (epoch seconds) so callers can cache the result.
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -26,6 +30,6 @@ def verify_token(token: str, credentials_exception):
         if email is None or role is None:
             raise credentials_exception
         
-        return TokenData(email=email, role=role)
+        return TokenData(email=email, role=role, id=payload.get("uid")), payload.get("exp")
     except JWTError:
         raise credentials_exception
\ No newline at end of file
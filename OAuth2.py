@@ -1,32 +1,86 @@
 from fastapi import Depends, HTTPException, status,Request
 from fastapi.security import OAuth2PasswordBearer
-from JWTtoken import verify_token
+from JWTtoken import verify_token_with_expiry
 import logging
-from typing import List
-from models import TokenData
+import os
+from typing import List, Optional
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import database
+from models import TokenData, User
+from ttl_cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+# Verified tokens, keyed by the raw token string; an entry never outlives the token's exp.
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    token_data = token_cache.get(token)
+    if token_data is not None:
+        return token_data
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        token_data = verify_token(token, credentials_exception)
-        logging.info(f"Extracted email and role from token: {token_data.email}, {token_data.role}")
-        return token_data
+        token_data, expires_at = verify_token_with_expiry(token, credentials_exception)
+        logging.debug("Extracted email and role from token: %s, %s", token_data.email, token_data.role)
     except Exception as e:
         logging.error(f"Error verifying token: {e}")
         raise credentials_exception
+    token_cache.set(token, token_data, expires_at)
+    return token_data
 
 def role_required(required_roles: List[str]):
-    def role_checker(token_data: TokenData = Depends(get_current_user)):
+    async def role_checker(token_data: TokenData = Depends(get_current_user)):
         if token_data.role not in required_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Insufficient permissions",
             )
         return token_data
-    return role_checker
\ No newline at end of file
+    return role_checker
+
+class Principal:
+    """The authenticated caller, resolved from the token without touching the database.
+
+    The full User row is only loaded, once per request, when a route awaits `load_user()`.
+    """
+
+    def __init__(self, token_data: TokenData, db: AsyncSession):
+        self.id = token_data.id
+        self.email = token_data.email
+        self.role = token_data.role
+        self._db = db
+        self._user = None
+
+    async def load_user(self) -> Optional[User]:
+        if self._user is None and self.id is not None:
+            self._user = await self._db.get(User, self.id)
+        return self._user
+
+async def resolve_principal(token_data: TokenData, db: AsyncSession) -> Principal:
+    if token_data.id is None:
+        # Tokens issued before the uid claim existed fall back to a lookup by email
+        user = (await db.exec(select(User).where(User.email == token_data.email))).first()
+        token_data = token_data.model_copy(update={"id": user.id if user else None})
+    return Principal(token_data, db)
+
+def principal_required(required_roles: List[str]):
+    async def principal_loader(
+        token_data: TokenData = Depends(role_required(required_roles)),
+        db: AsyncSession = Depends(database.get_db)
+    ):
+        return await resolve_principal(token_data, db)
+    return principal_loader
+
+async def principal_from_token(token: str, required_roles: List[str], db: AsyncSession) -> Principal:
+    """The token flow of principal_required, for callers outside HTTP dependencies (WebSocket handshakes)."""
+    token_data = await role_required(required_roles)(await get_current_user(token))
+    return await resolve_principal(token_data, db)
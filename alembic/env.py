@@ -0,0 +1,68 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import Column, engine_from_config, pool
+from sqlmodel import SQLModel
+
+import database
+import models  # noqa: F401  registers the tables on SQLModel.metadata
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# Migrate the database the app is configured for (DATABASE_URL), not the placeholder in alembic.ini
+config.set_main_option("sqlalchemy.url", database.DATABASE_URL.replace("%", "%%"))
+
+target_metadata = SQLModel.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ != "index":
+        return True
+    # Expression indexes cannot be compared by autogenerate; they are managed by hand
+    if any(not isinstance(expression, Column) for expression in object.expressions):
+        return False
+    # Indexes declared with Index.ddl_if(dialect=...) only exist on that dialect
+    ddl_if = getattr(object, "_ddl_if", None)
+    if ddl_if is not None and ddl_if.dialect:
+        return ddl_if.dialect == context.get_context().dialect.name
+    return True
+
+
+def run_migrations_offline() -> None:
+    """Emit the migration SQL to stdout (alembic upgrade head --sql)."""
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=True,
+        include_object=include_object,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connectable = engine_from_config(
+        config.get_section(config.config_ini_section, {}),
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+
+    with connectable.connect() as connection:
+        # Batch mode lets the same migrations alter tables on SQLite in development
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True,
+                          include_object=include_object)
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,121 @@
+"""initial schema
+
+The schema as create_all() built it before the scheduler, broadcasts and
+catalog search indexes; everything added since has its own revision. Databases
+created by create_all should be stamped at this revision (alembic stamp 0001)
+and upgraded: the later revisions skip tables and columns that already exist.
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 18:18:43.190408
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('author',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('pen_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('email', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email')
+    )
+    with op.batch_alter_table('author', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_author_pen_name'), ['pen_name'], unique=False)
+
+    op.create_table('book',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('genre', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('pages', sa.Integer(), nullable=True),
+    sa.Column('total_copies', sa.Integer(), nullable=False),
+    sa.Column('copies_available', sa.Integer(), nullable=True),
+    sa.Column('copies_on_rent', sa.Integer(), nullable=False),
+    sa.Column('next_available_on', sa.Date(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_book_genre'), ['genre'], unique=False)
+        batch_op.create_index(batch_op.f('ix_book_title'), ['title'], unique=False)
+
+    op.create_table('notification',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('message', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('is_read', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('first_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('last_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('email', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('password', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('role', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email')
+    )
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_first_name'), ['first_name'], unique=False)
+        batch_op.create_index(batch_op.f('ix_user_last_name'), ['last_name'], unique=False)
+
+    op.create_table('bookauthorassociation',
+    sa.Column('book_id', sa.Integer(), nullable=True),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['author.id'], ),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+    sa.PrimaryKeyConstraint('book_id', 'author_id')
+    )
+    op.create_table('loan',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('borrower_id', sa.Integer(), nullable=False),
+    sa.Column('borrowed_book_id', sa.Integer(), nullable=False),
+    sa.Column('issue_date', sa.Date(), nullable=False),
+    sa.Column('due_date', sa.Date(), nullable=False),
+    sa.Column('returned', sa.Boolean(), nullable=False),
+    sa.Column('overdue', sa.Boolean(), nullable=False),
+    sa.Column('loan_amount', sa.Integer(), nullable=False),
+    sa.Column('fine', sa.Integer(), nullable=False),
+    sa.Column('loan_requested', sa.Boolean(), nullable=True),
+    sa.Column('loan_approved', sa.Boolean(), nullable=True),
+    sa.Column('return_requested', sa.Boolean(), nullable=True),
+    sa.Column('return_accepted', sa.Boolean(), nullable=True),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=True),
+    sa.Column('cancel_accepted', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['borrowed_book_id'], ['book.id'], ),
+    sa.ForeignKeyConstraint(['borrower_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('loan')
+    op.drop_table('bookauthorassociation')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_last_name'))
+        batch_op.drop_index(batch_op.f('ix_user_first_name'))
+
+    op.drop_table('user')
+    op.drop_table('notification')
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_book_title'))
+        batch_op.drop_index(batch_op.f('ix_book_genre'))
+
+    op.drop_table('book')
+    with op.batch_alter_table('author', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_author_pen_name'))
+
+    op.drop_table('author')
@@ -0,0 +1,34 @@
+"""loan reminder_sent_for
+
+The due date a reminder was last sent for, so the due_reminders job notifies
+each loan once per due date. Databases built by create_all after the column
+was added already have it and are left as they are.
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-19 09:12:27.604113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001a'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('loan')}
+    if 'reminder_sent_for' not in columns:
+        with op.batch_alter_table('loan', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('reminder_sent_for', sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('loan', schema=None) as batch_op:
+        batch_op.drop_column('reminder_sent_for')
@@ -0,0 +1,40 @@
+"""job lease
+
+Lease rows the scheduler claims so only one worker runs each job per interval.
+
+Revision ID: 0001b
+Revises: 0001a
+Create Date: 2026-10-19 09:31:52.840716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001b'
+down_revision: Union[str, None] = '0001a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all may already have built it on a database stamped at 0001
+    if sa.inspect(op.get_bind()).has_table('joblease'):
+        return
+    op.create_table('joblease',
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('leased_until', sa.DateTime(), nullable=False),
+    sa.Column('last_started_at', sa.DateTime(), nullable=True),
+    sa.Column('last_duration_ms', sa.Float(), nullable=True),
+    sa.Column('last_rows', sa.Integer(), nullable=True),
+    sa.Column('last_error', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('joblease')
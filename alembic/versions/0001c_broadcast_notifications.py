@@ -0,0 +1,54 @@
+"""broadcast notifications
+
+One stored message per role broadcast, with a receipt per user who has read it.
+
+Revision ID: 0001c
+Revises: 0001b
+Create Date: 2026-10-19 09:38:14.265093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001c'
+down_revision: Union[str, None] = '0001b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all may already have built them on a database stamped at 0001
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('broadcastnotification'):
+        op.create_table('broadcastnotification',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('role', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('message', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('broadcastnotification', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_broadcastnotification_role'), ['role'], unique=False)
+
+    if not inspector.has_table('broadcastreceipt'):
+        op.create_table('broadcastreceipt',
+        sa.Column('broadcast_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('read_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['broadcast_id'], ['broadcastnotification.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('broadcast_id', 'user_id')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('broadcastreceipt')
+    with op.batch_alter_table('broadcastnotification', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_broadcastnotification_role'))
+
+    op.drop_table('broadcastnotification')
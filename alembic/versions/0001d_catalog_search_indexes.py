@@ -0,0 +1,48 @@
+"""catalog search indexes
+
+PostgreSQL only: the pg_trgm extension, trigram indexes for ILIKE / similarity()
+on titles, genres and pen names, and the tsvector index for full-text search.
+Built CONCURRENTLY so the migration does not block writes on a live database.
+
+Revision ID: 0001d
+Revises: 0001c
+Create Date: 2026-10-19 09:44:03.519872
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001d'
+down_revision: Union[str, None] = '0001c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_author_pen_name_trgm', 'author', ['pen_name'], {'postgresql_ops': {'pen_name': 'gin_trgm_ops'}}),
+    ('ix_book_title_trgm', 'book', ['title'], {'postgresql_ops': {'title': 'gin_trgm_ops'}}),
+    ('ix_book_genre_trgm', 'book', ['genre'], {'postgresql_ops': {'genre': 'gin_trgm_ops'}}),
+    ('ix_book_search_document', 'book',
+     [sa.text("to_tsvector('simple'::regconfig, coalesce(title, '') || ' ' || coalesce(genre, ''))")], {}),
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_using='gin',
+                            postgresql_concurrently=True, if_not_exists=True, **kwargs)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
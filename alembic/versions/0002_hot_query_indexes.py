@@ -0,0 +1,47 @@
+"""hot query indexes
+
+Composite and partial indexes for the queries every request path runs: a
+user's notifications and loan history newest first, open loans by borrower
+and by book, users by role and books by author. On PostgreSQL they are built
+CONCURRENTLY so the migration does not block writes on a live database.
+
+Revision ID: 0002
+Revises: 0001d
+Create Date: 2026-10-18 18:40:12.512904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_notification_user_id_created_at', 'notification', ['user_id', 'created_at', 'id'], {}),
+    ('ix_loan_borrower_id_issue_date', 'loan', ['borrower_id', 'issue_date', 'id'], {}),
+    ('ix_loan_borrower_id_returned', 'loan', ['borrower_id', 'returned'], {}),
+    ('ix_loan_open_borrowed_book_id_due_date', 'loan', ['borrowed_book_id', 'due_date'],
+     {'postgresql_where': sa.text('returned = false'), 'sqlite_where': sa.text('returned = false')}),
+    ('ix_user_role', 'user', ['role'], {}),
+    ('ix_bookauthorassociation_author_id', 'bookauthorassociation', ['author_id'], {}),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True,
+                            if_not_exists=True, **kwargs)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
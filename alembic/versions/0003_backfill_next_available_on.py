@@ -0,0 +1,33 @@
+"""backfill next_available_on
+
+Book.next_available_on is now maintained by every checkout and check-in (the
+earliest due date among the book's copies on rent). Fill it in once for the
+books already in the database.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 19:02:37.118530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "UPDATE book SET next_available_on = ("
+        "SELECT min(loan.due_date) FROM loan"
+        " WHERE loan.borrowed_book_id = book.id AND loan.returned = false AND loan.loan_approved = true)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("UPDATE book SET next_available_on = NULL")
@@ -0,0 +1,34 @@
+"""unread notification index
+
+Partial index on a user's unread notifications, so unread badges are counted
+from the index alone. Built CONCURRENTLY on PostgreSQL.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 19:21:05.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_notification_unread_user_id', 'notification', ['user_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True,
+                        postgresql_where=sa.text('is_read = false'), sqlite_where=sa.text('is_read = false'))
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_notification_unread_user_id', table_name='notification',
+                      postgresql_concurrently=True, if_exists=True)
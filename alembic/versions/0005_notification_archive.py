@@ -0,0 +1,59 @@
+"""notification archive
+
+Archive table for notifications past their retention window, and an index on
+notification (created_at, id) so the archival job reads the oldest rows without
+scanning the table. The index is built CONCURRENTLY on PostgreSQL. On SQLite
+the notification table is rebuilt with AUTOINCREMENT so archived ids are not
+reused.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 20:02:41.730915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('notificationarchive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('message', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('is_read', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('notificationarchive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_notificationarchive_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_notificationarchive_created_at'), ['created_at'], unique=False)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('notification', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_notification_created_at_id', 'notification', ['created_at', 'id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_notification_created_at_id', table_name='notification',
+                      postgresql_concurrently=True, if_exists=True)
+
+    with op.batch_alter_table('notificationarchive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notificationarchive_created_at'))
+        batch_op.drop_index(batch_op.f('ix_notificationarchive_user_id'))
+    op.drop_table('notificationarchive')
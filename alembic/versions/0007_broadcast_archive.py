@@ -0,0 +1,57 @@
+"""broadcast archive
+
+Archive table for broadcasts past their retention window, and an index on
+broadcastnotification (created_at, id) for the archival job, built CONCURRENTLY
+on PostgreSQL. On SQLite the broadcastnotification table is rebuilt with
+AUTOINCREMENT so archived ids are not reused.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 21:34:09.118240
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('broadcastnotificationarchive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('role', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('message', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('broadcastnotificationarchive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_broadcastnotificationarchive_role'), ['role'], unique=False)
+        batch_op.create_index(batch_op.f('ix_broadcastnotificationarchive_created_at'), ['created_at'], unique=False)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('broadcastnotification', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_broadcastnotification_created_at_id', 'broadcastnotification', ['created_at', 'id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_broadcastnotification_created_at_id', table_name='broadcastnotification',
+                      postgresql_concurrently=True, if_exists=True)
+
+    with op.batch_alter_table('broadcastnotificationarchive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_broadcastnotificationarchive_created_at'))
+        batch_op.drop_index(batch_op.f('ix_broadcastnotificationarchive_role'))
+    op.drop_table('broadcastnotificationarchive')
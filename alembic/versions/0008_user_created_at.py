@@ -0,0 +1,41 @@
+"""user created_at
+
+Records when each account was created, so broadcasts sent before a user joined
+are not listed or counted as unread for them. Existing accounts predate the
+column and are backfilled with the oldest broadcast's time, keeping every
+broadcast they could see before visible.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 23:05:41.502117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+
+    user = sa.table('user', sa.column('created_at', sa.DateTime()))
+    broadcast = sa.table('broadcastnotification', sa.column('created_at', sa.DateTime()))
+    oldest = sa.select(sa.func.min(broadcast.c.created_at)).scalar_subquery()
+    op.execute(user.update().values(created_at=sa.func.coalesce(oldest, sa.func.current_timestamp())))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('created_at')
@@ -0,0 +1,58 @@
+"""broadcast read watermark
+
+Per-user watermark below which every broadcast counts as read, and an index on
+broadcastnotification (role, id), so unread counts only read a role's
+broadcasts above the watermark. Existing users get the id just below their
+oldest unread broadcast. The index is built CONCURRENTLY on PostgreSQL.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 10:26:48.931305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_broadcast_id', sa.Integer(), nullable=True))
+
+    user = sa.table('user', sa.column('id', sa.Integer()), sa.column('role', sa.String()),
+                    sa.column('created_at', sa.DateTime()), sa.column('last_read_broadcast_id', sa.Integer()))
+    broadcast = sa.table('broadcastnotification', sa.column('id', sa.Integer()), sa.column('role', sa.String()),
+                         sa.column('created_at', sa.DateTime()))
+    receipt = sa.table('broadcastreceipt', sa.column('broadcast_id', sa.Integer()), sa.column('user_id', sa.Integer()))
+    oldest_unread = (sa.select(sa.func.min(broadcast.c.id))
+                     .where(broadcast.c.role == user.c.role,
+                            broadcast.c.created_at >= user.c.created_at,
+                            ~sa.exists().where(receipt.c.broadcast_id == broadcast.c.id,
+                                               receipt.c.user_id == user.c.id).correlate(user, broadcast))
+                     .scalar_subquery())
+    newest = sa.select(sa.func.max(broadcast.c.id)).scalar_subquery()
+    op.execute(user.update().values(last_read_broadcast_id=sa.func.coalesce(oldest_unread - 1, newest, 0)))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('last_read_broadcast_id', existing_type=sa.Integer(), nullable=False)
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_broadcastnotification_role_id', 'broadcastnotification', ['role', 'id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_broadcastnotification_role_id', table_name='broadcastnotification',
+                      postgresql_concurrently=True, if_exists=True)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('last_read_broadcast_id')
@@ -0,0 +1,108 @@
+"""Export throughput: rows per second and peak memory while streaming the loan ledger.
+
+Seeds a PostgreSQL database (DATABASE_URL) with synthetic users, books and loans
+using COPY, then drains /export/loans and /export/books in both formats through
+the route handlers and reports rows/s. Peak RSS should stay flat as --loans grows.
+
+    DATABASE_URL=postgresql+psycopg2://... python benchmarks/export_benchmark.py --loans 2000000
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import resource
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlmodel import SQLModel
+
+import database
+from routers import export_route
+
+
+def copy(cursor, table: str, columns: str, lines):
+    buffer = io.StringIO()
+    buffer.writelines(lines)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+
+
+def seed(loans: int, users: int = 1000, books: int = 10000, batch: int = 200_000):
+    rng = random.Random(7)
+    today = date.today()
+    raw = database.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        copy(cursor, '"user"', "first_name, last_name, email, password, role",
+             (f"F{i}\tL{i}\tuser{i}@bench.test\tx\tMember\n" for i in range(users)))
+        copy(cursor, "book", "title, genre, pages, total_copies, copies_available, copies_on_rent",
+             (f"Book {i}\tGenre {i % 20}\t{100 + i % 400}\t5\t5\t0\n" for i in range(books)))
+        cursor.execute('SELECT min(id) FROM "user"')
+        first_user = cursor.fetchone()[0]
+        cursor.execute("SELECT min(id) FROM book")
+        first_book = cursor.fetchone()[0]
+        for start in range(0, loans, batch):
+            lines = []
+            for _ in range(min(batch, loans - start)):
+                issued = today - timedelta(days=rng.randint(0, 720))
+                returned = rng.random() < 0.8
+                lines.append(f"{first_user + rng.randrange(users)}\t{first_book + rng.randrange(books)}\t{issued}\t"
+                             f"{issued + timedelta(days=15)}\t{returned}\tfalse\t50\t0\ttrue\ttrue\t{returned}\t{returned}\tfalse\tfalse\n")
+            copy(cursor, "loan", "borrower_id, borrowed_book_id, issue_date, due_date, returned, overdue, loan_amount, fine, "
+                 "loan_requested, loan_approved, return_requested, return_accepted, cancel_requested, cancel_accepted", lines)
+            raw.commit()
+            print(f"seeded {min(start + batch, loans):,} / {loans:,} loans", end="\r", flush=True)
+        cursor.execute("ANALYZE")
+        raw.commit()
+    finally:
+        raw.close()
+    print()
+
+
+async def drain(response) -> tuple:
+    rows = size = 0
+    async for chunk in response.body_iterator:
+        rows += chunk.count("\n")
+        size += len(chunk)
+    return rows, size
+
+
+async def run():
+    cases = [
+        ("loans ndjson", export_route.export_loans(format="ndjson", issued_from=None, issued_to=None, returned=None, overdue=None, token_data=None)),
+        ("loans csv", export_route.export_loans(format="csv", issued_from=None, issued_to=None, returned=None, overdue=None, token_data=None)),
+        ("open loans csv", export_route.export_loans(format="csv", issued_from=None, issued_to=None, returned=False, overdue=None, token_data=None)),
+        ("books ndjson", export_route.export_books(format="ndjson", token_data=None)),
+    ]
+    print(f"{'export':<16} {'rows':>10} {'MB':>8} {'seconds':>8} {'rows/s':>10} {'peak RSS MB':>12}")
+    for name, handler in cases:
+        started = time.perf_counter()
+        rows, size = await drain(await handler)
+        elapsed = time.perf_counter() - started
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{name:<16} {rows:>10,} {size / 1e6:>8.1f} {elapsed:>8.2f} {rows / elapsed:>10,.0f} {peak:>12.0f}")
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loans", type=int, default=2_000_000)
+    parser.add_argument("--skip-load", action="store_true", help="reuse rows already in the database")
+    args = parser.parse_args()
+
+    if database.engine.dialect.name != "postgresql":
+        sys.exit("The export benchmark needs DATABASE_URL to point at PostgreSQL.")
+
+    SQLModel.metadata.create_all(database.engine)
+    if not args.skip_load:
+        seed(args.loans)
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
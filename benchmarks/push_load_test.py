@@ -0,0 +1,131 @@
+"""Push delivery under load: many idle WebSocket subscribers, then a burst of fan-out.
+
+Opens --connections sockets to /notifications/ws as one librarian and holds them
+idle for --idle seconds (long enough to cross a few heartbeats). It then triggers
+--rounds role broadcasts: a member's cancellation request notifies every
+librarian, so each round is one commit fanned out to every socket. Reports
+connect times, how many sockets got each event and delivery latency from the
+triggering request. Run it against the server with the target number of
+workers, and raise the open-file limit on both sides first (ulimit -n 65536).
+
+    python benchmarks/push_load_test.py --url http://localhost:8000 --connections 10000 --title "Python"
+"""
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import time
+
+import httpx
+import websockets
+
+
+def percentiles(values):
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return f"p50 {pick(0.5) * 1000:.1f} ms, p95 {pick(0.95) * 1000:.1f} ms, p99 {pick(0.99) * 1000:.1f} ms, max {values[-1] * 1000:.1f} ms"
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    response = await client.post("/login", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+class Listener:
+    def __init__(self):
+        self.arrivals = {}
+        self.socket = None
+
+    async def run(self, uri: str, connected: asyncio.Event, ready: list, failures: list, semaphore: asyncio.Semaphore):
+        started = time.perf_counter()
+        try:
+            async with semaphore:
+                self.socket = await websockets.connect(uri, ping_interval=None, open_timeout=60, max_queue=None)
+            ready.append(time.perf_counter() - started)
+        except Exception as e:
+            failures.append(repr(e))
+            return
+        finally:
+            connected.set()
+        try:
+            async for raw in self.socket:
+                event = json.loads(raw)
+                if event.get("type") == "notification":
+                    self.arrivals[event["message"]] = time.perf_counter()
+        except websockets.ConnectionClosed:
+            pass
+
+
+async def main(args):
+    ws_base = re.sub(r"^http", "ws", args.url.rstrip("/"))
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        librarian = await login(client, args.librarian, args.password)
+        member = await login(client, args.member, args.password)
+        member_headers = {"Authorization": f"Bearer {member}"}
+
+        loan_id = args.loan_id
+        if loan_id is None:
+            response = await client.post("/loan/User/create_loan", params={"rent_title": args.title}, headers=member_headers)
+            found = re.search(r"ID: (\d+)", response.json().get("message", ""))
+            if not found:
+                raise SystemExit(f"Could not open a loan request to trigger broadcasts with: {response.text} (pass --loan-id)")
+            loan_id = int(found.group(1))
+
+        listeners = [Listener() for _ in range(args.connections)]
+        ready, failures = [], []
+        semaphore = asyncio.Semaphore(args.concurrency)
+        uri = f"{ws_base}/notifications/ws?token={librarian}"
+        started = time.perf_counter()
+        events = [asyncio.Event() for _ in listeners]
+        tasks = [asyncio.create_task(listener.run(uri, event, ready, failures, semaphore))
+                 for listener, event in zip(listeners, events)]
+        await asyncio.gather(*(event.wait() for event in events))
+        print(f"connected {len(ready)}/{args.connections} in {time.perf_counter() - started:.1f} s "
+              f"(connect {percentiles(ready)}), {len(failures)} failed")
+        if failures:
+            print("  first failure:", failures[0])
+
+        await asyncio.sleep(args.idle)
+        metrics = await client.get("/metrics/notification_push", headers={"Authorization": f"Bearer {librarian}"})
+        print("server (one worker):", metrics.json())
+
+        live = [listener for listener in listeners if listener.socket is not None]
+        for round_number in range(args.rounds):
+            sent = time.perf_counter()
+            response = await client.post("/loan/User/cancel_loan", params={"loan_id": loan_id}, headers=member_headers)
+            response.raise_for_status()
+            # The broadcast text is fixed per loan, so track arrivals newer than this request
+            deadline = sent + args.timeout
+            while time.perf_counter() < deadline:
+                got = [listener for listener in live if any(at >= sent for at in listener.arrivals.values())]
+                if len(got) == len(live):
+                    break
+                await asyncio.sleep(0.05)
+            latencies = [max(listener.arrivals.values()) - sent for listener in live
+                         if listener.arrivals and max(listener.arrivals.values()) >= sent]
+            print(f"round {round_number + 1}: delivered to {len(latencies)}/{len(live)} sockets, {percentiles(latencies)}"
+                  + (f", mean {statistics.mean(latencies) * 1000:.1f} ms" if latencies else ""))
+
+        for listener in live:
+            await listener.socket.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=500, help="handshakes in flight at once")
+    parser.add_argument("--idle", type=float, default=30, help="seconds to hold the sockets idle before the bursts")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for each round to reach every socket")
+    parser.add_argument("--librarian", default="lib@mail.com")
+    parser.add_argument("--member", default="test@mail.com")
+    parser.add_argument("--password", default="pass@123")
+    parser.add_argument("--title", default="Python", help="book the member requests to open the loan used as trigger")
+    parser.add_argument("--loan-id", type=int, help="pending loan of the member to use instead of opening one")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+"""Catalog search latency: legacy ILIKE scan vs the indexed search engine.
+
+Seeds a PostgreSQL database (DATABASE_URL) with synthetic books using COPY and
+then times the same searches twice: once through search.search_books_query,
+and once as the old unindexed ILIKE query with index scans disabled.
+
+    DATABASE_URL=postgresql+psycopg2://... python benchmarks/search_benchmark.py --rows 1000000
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, select
+
+import database
+import search
+from models import Book
+
+WORDS = ("python", "garden", "history", "ocean", "silent", "empire", "quantum", "kitchen", "winter",
+         "dragon", "river", "machine", "learning", "shadow", "mountain", "design", "secret", "city",
+         "stars", "economics", "poetry", "forest", "code", "journey", "island", "music", "letters")
+GENRES = ("Programming", "Fiction", "History", "Science", "Poetry", "Cooking", "Travel", "Fantasy")
+SEARCHES = ({"title": "quantum"}, {"title": "dragon river"}, {"genre": "poetry"},
+            {"q": "silent ocean"}, {"q": "machine learning"}, {"title": "empire", "genre": "history"})
+
+
+def load_books(rows: int, batch: int = 100_000):
+    rng = random.Random(42)
+    raw = database.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for start in range(0, rows, batch):
+            buffer = io.StringIO()
+            for _ in range(min(batch, rows - start)):
+                title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+                copies = rng.randint(1, 5)
+                buffer.write(f"{title}\t{rng.choice(GENRES)}\t{rng.randint(80, 900)}\t{copies}\t{copies}\t0\n")
+            buffer.seek(0)
+            cursor.copy_expert("COPY book (title, genre, pages, total_copies, copies_available, copies_on_rent) FROM STDIN", buffer)
+            raw.commit()
+            print(f"loaded {min(start + batch, rows):,} / {rows:,}", end="\r", flush=True)
+        cursor.execute("ANALYZE book")
+        raw.commit()
+    finally:
+        raw.close()
+    print()
+
+
+def legacy_query(params: dict):
+    query = select(Book)
+    if params.get("title"):
+        query = query.where(Book.title.ilike(f"%{params['title']}%"))
+    if params.get("genre"):
+        query = query.where(Book.genre.ilike(f"%{params['genre']}%"))
+    if params.get("q"):
+        query = query.where(Book.title.ilike(f"%{params['q']}%") | Book.genre.ilike(f"%{params['q']}%"))
+    return query
+
+
+def time_query(build, params: dict, repeat: int, seqscan: bool):
+    timings = []
+    with Session(database.engine) as db:
+        for _ in range(repeat):
+            if seqscan:
+                db.exec(text("SET LOCAL enable_indexscan = off"))
+                db.exec(text("SET LOCAL enable_bitmapscan = off"))
+            started = time.perf_counter()
+            db.exec(build(params).offset(0).limit(10)).all()
+            timings.append((time.perf_counter() - started) * 1000)
+            db.rollback()
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-load", action="store_true", help="reuse books already in the database")
+    args = parser.parse_args()
+
+    if database.engine.dialect.name != "postgresql":
+        sys.exit("The search benchmark needs DATABASE_URL to point at PostgreSQL.")
+
+    SQLModel.metadata.create_all(database.engine)
+    if not args.skip_load:
+        load_books(args.rows)
+
+    print(f"{'search':<40} {'legacy p50':>11} {'legacy max':>11} {'engine p50':>11} {'engine max':>11}")
+    for params in SEARCHES:
+        legacy = time_query(legacy_query, params, args.repeat, seqscan=True)
+        engine = time_query(lambda p: search.search_books_query(True, **p), params, args.repeat, seqscan=False)
+        label = ", ".join(f"{k}={v}" for k, v in params.items())
+        print(f"{label:<40} {legacy[0]:>9.1f}ms {legacy[1]:>9.1f}ms {engine[0]:>9.1f}ms {engine[1]:>9.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
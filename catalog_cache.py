@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import event
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from ttl_cache import TTLCache
+
+CATALOG_CACHE_URL = os.getenv("CATALOG_CACHE_URL", "")
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "1024"))
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "60"))
+VERSION_KEY = "catalog:version"
+
+
+class LocalBackend:
+    """Per-process LRU + TTL store. Each worker keeps its own entries and version.
+
+    A commit only bumps the version of the worker that made it: other workers keep
+    serving their entries until the TTL expires them.
+    """
+
+    name = "local"
+    remote = False
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = TTLCache(maxsize, ttl)
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def version(self) -> int:
+        return self._version
+
+    def bump(self) -> int:
+        with self._lock:
+            self._version += 1
+            return self._version
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.entries.get(key)
+
+    def set(self, key: str, value: Any):
+        self.entries.set(key, value)
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+
+class RedisBackend:
+    """Store shared by every worker: one version counter, entries expiring after the TTL.
+
+    Size is bounded by the server's eviction policy (e.g. maxmemory with allkeys-lru).
+    """
+
+    name = "redis"
+    remote = True
+
+    def __init__(self, client, ttl: float):
+        self.client = client
+        self.ttl = ttl
+
+    def version(self) -> int:
+        return int(self.client.get(VERSION_KEY) or 0)
+
+    def bump(self) -> int:
+        return self.client.incr(VERSION_KEY)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.client.get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key: str, value: Any):
+        self.client.set(key, json.dumps(value), px=int(self.ttl * 1000))
+
+    def stats(self) -> dict:
+        return {"ttl_seconds": self.ttl}
+
+
+class InMemoryRedis:
+    """Stand-in for a Redis client (get / set with px / incr) for tests and single-process runs."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value, expires_at = self._data.get(key, (None, None))
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value, px: Optional[int] = None):
+        with self._lock:
+            value = value if isinstance(value, bytes) else str(value).encode()
+            self._data[key] = (value, time.time() + px / 1000 if px else None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._data.get(key, (b"0", None))[0]) + 1
+            self._data[key] = (str(value).encode(), None)
+            return value
+
+
+def make_backend(url: str = CATALOG_CACHE_URL):
+    if not url:
+        return LocalBackend(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL_SECONDS)
+    if url == "memory://":
+        return RedisBackend(InMemoryRedis(), CATALOG_CACHE_TTL_SECONDS)
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError("CATALOG_CACHE_URL points at Redis but the redis package is not installed.")
+    return RedisBackend(redis.Redis.from_url(url), CATALOG_CACHE_TTL_SECONDS)
+
+
+def cache_key(namespace: str, version: int, params: dict) -> str:
+    # Searches are case-insensitive, so case-only variants share an entry; cursors are not
+    normalized = {key: value.lower() if isinstance(value, str) and key != "cursor" else value
+                  for key, value in params.items() if value is not None}
+    return f"catalog:{version}:{namespace}:{json.dumps(normalized, sort_keys=True)}"
+
+
+class CatalogCache:
+    """Read-through cache for catalog reads, invalidated by a catalog version counter.
+
+    Keys embed the current version, so bumping it retires every cached result at
+    once; orphaned entries age out through LRU eviction or the TTL.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def _call(self, fn, *args):
+        # A network backend is called from the threadpool so it never blocks the event loop
+        return await run_in_threadpool(fn, *args) if self.backend.remote else fn(*args)
+
+    async def get_or_load(self, namespace: str, params: dict, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if CATALOG_CACHE_TTL_SECONDS <= 0:
+            return await loader()
+        # Read the version before loading, so a result that races a change is filed under the old version
+        version = await self._call(self.backend.version)
+        key = cache_key(namespace, version, params)
+        value = await self._call(self.backend.get, key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = await loader()
+        await self._call(self.backend.set, key, value)
+        return value
+
+    def invalidate(self):
+        self.invalidations += 1
+        self.backend.bump()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "version": self.backend.version(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            **self.backend.stats(),
+        }
+
+
+catalog_cache = CatalogCache(make_backend())
+
+
+def mark_changed(db):
+    """Flag the session's transaction as a catalog change; the version is bumped once it commits.
+
+    Cached pages hold whole search results, inventory included, so every writer of a
+    field they show must call this: book and author edits, catalog_import, and every
+    inventory.checkout / checkin (loan approval, return and cancellation).
+    """
+    db.info["catalog_changed"] = True
+
+
+def _invalidate_logged():
+    try:
+        catalog_cache.invalidate()
+    except Exception:
+        logging.exception("Catalog cache invalidation failed")
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session):
+    if not session.info.pop("catalog_changed", False):
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None and catalog_cache.backend.remote:
+        # AsyncSession commits on the event loop, where a network round trip would stall
+        # every request; the bump runs in the threadpool moments after the commit instead
+        loop.run_in_executor(None, _invalidate_logged)
+    else:
+        catalog_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("catalog_changed", None)
@@ -0,0 +1,172 @@
+import csv
+import io
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, text
+from sqlalchemy.util import await_only
+from sqlmodel import Session, select
+
+import catalog_cache
+from models import Author, Book, BookAuthorAssociation, BookCreate
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+FORMATS = ("csv", "ndjson")
+# CSV rows list several authors in one column: "Pen One;Pen Two"
+PEN_NAME_SEPARATOR = ";"
+
+BOOK_COLUMNS = ["id", "title", "genre", "pages", "total_copies", "copies_available", "copies_on_rent"]
+ASSOCIATION_COLUMNS = ["book_id", "author_id"]
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    failed: int = 0
+    batches: int = 0
+    errors: List[dict] = field(default_factory=list)
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+
+def format_for(filename: Optional[str], requested: Optional[str]) -> Optional[str]:
+    if requested:
+        return requested.lower() if requested.lower() in FORMATS else None
+    suffix = (filename or "").rsplit(".", 1)[-1].lower()
+    if suffix == "csv":
+        return "csv"
+    if suffix in ("ndjson", "jsonl"):
+        return "ndjson"
+    return None
+
+
+def read_rows(upload: IO[bytes], fmt: str) -> Iterator[Tuple[int, object]]:
+    """Yield (line number, raw row) from the upload without reading it all into memory.
+
+    The raw row is a dict, or an error message when the line cannot be parsed.
+    """
+    stream = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            row = {key.strip(): value for key, value in row.items() if key}
+            pen_names = row.get("author_pen_names") or ""
+            row["author_pen_names"] = pen_names.split(PEN_NAME_SEPARATOR)
+            yield reader.line_num, {key: value if value != "" else None for key, value in row.items()}
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, f"Invalid JSON: {exc}"
+            continue
+        yield line_number, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+def next_batch(rows: Iterator[Tuple[int, object]], size: int, report: ImportReport) -> List[Tuple[int, BookCreate]]:
+    """Validate the next `size` rows; rows that fail validation go straight to the report."""
+    batch = []
+    for line_number, raw in rows:
+        if isinstance(raw, str):
+            report.error(line_number, raw)
+        else:
+            try:
+                book = BookCreate.model_validate(raw)
+            except ValidationError as exc:
+                report.error(line_number, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors()))
+            else:
+                if book.total_copies < 0 or (book.pages is not None and book.pages < 0):
+                    report.error(line_number, "total_copies and pages must not be negative")
+                elif not book.title.strip():
+                    report.error(line_number, "title must not be empty")
+                else:
+                    book.author_pen_names = list(dict.fromkeys(
+                        name.strip() for name in book.author_pen_names or [] if name and name.strip()))
+                    batch.append((line_number, book))
+        if len(batch) >= size:
+            break
+    return batch
+
+
+def resolve_pen_names(db: Session, batch: List[Tuple[int, BookCreate]]) -> Dict[str, int]:
+    # One lookup per batch; duplicate pen names resolve to the oldest author, as create_book does
+    names = {name for _, book in batch for name in book.author_pen_names}
+    if not names:
+        return {}
+    authors = {}
+    for author_id, pen_name in db.exec(select(Author.id, Author.pen_name).where(Author.pen_name.in_(names)).order_by(Author.id)):
+        authors.setdefault(pen_name, author_id)
+    return authors
+
+
+def reserve_book_ids(db: Session, count: int) -> List[int]:
+    return list(db.exec(text("SELECT nextval(pg_get_serial_sequence('book', 'id')) FROM generate_series(1, :n)")
+                        .bindparams(n=count)).scalars())
+
+
+def copy_rows(db: Session, table: str, columns: List[str], records: List[tuple]):
+    """COPY records into `table` on the session's connection and transaction."""
+    connection = db.connection().connection
+    driver = db.get_bind().dialect.driver
+    if driver == "asyncpg":
+        await_only(connection.driver_connection.copy_records_to_table(table, records=records, columns=columns))
+        return
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(records)
+    buffer.seek(0)
+    with connection.dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def write_batch(db: Session, batch: List[Tuple[int, BookCreate]], report: ImportReport):
+    """Insert one validated batch of books and their author links, committed on its own."""
+    report.batches += 1
+    authors = resolve_pen_names(db, batch)
+    rows = []
+    for line_number, book in batch:
+        missing = [name for name in book.author_pen_names if name not in authors]
+        if missing:
+            report.error(line_number, f"Author pen names {', '.join(missing)} not found")
+        else:
+            rows.append((line_number, book))
+    if not rows:
+        return
+
+    records = [(book.title, book.genre, book.pages, book.total_copies, book.total_copies, 0) for _, book in rows]
+    bind = db.get_bind()
+    use_copy = bind.dialect.name == "postgresql" and bind.dialect.driver in ("asyncpg", "psycopg2")
+    try:
+        if use_copy:
+            ids = reserve_book_ids(db, len(rows))
+            copy_rows(db, "book", BOOK_COLUMNS, [(book_id, *record) for book_id, record in zip(ids, records)])
+        else:
+            ids = list(db.exec(
+                insert(Book).returning(Book.id, sort_by_parameter_order=True),
+                params=[dict(zip(BOOK_COLUMNS[1:], record)) for record in records]
+            ).scalars())
+
+        links = [(book_id, authors[name]) for book_id, (_, book) in zip(ids, rows) for name in book.author_pen_names]
+        if links and use_copy:
+            copy_rows(db, "bookauthorassociation", ASSOCIATION_COLUMNS, links)
+        elif links:
+            db.exec(insert(BookAuthorAssociation), params=[dict(zip(ASSOCIATION_COLUMNS, link)) for link in links])
+        catalog_cache.mark_changed(db)
+        db.commit()
+    except Exception as exc:
+        # COPY raises driver errors rather than SQLAlchemy ones. Either way only this
+        # batch is lost: its rows are reported and earlier and later batches still load.
+        db.rollback()
+        for line_number, _ in rows:
+            report.error(line_number, f"Batch rejected by the database: {exc.__class__.__name__}")
+        return
+    report.imported += len(rows)
@@ -1,14 +1,204 @@
+import os
+import time
+from functools import partial
 
-from sqlmodel import create_engine, SQLModel,Session
+from fastapi import Depends
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-DATABASE_URL = "postgresql+psycopg2://myuser:mypassword@my_postgres:5432/mydatabase"
-engine = create_engine(DATABASE_URL)
+from metrics import Histogram
 
-# Create the database tables
-def init_db():
-    SQLModel.metadata.create_all(bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg2://myuser:mypassword@my_postgres:5432/mydatabase")
 
-def get_db():
-    # Use a context manager for the session
-    with Session(engine) as db:
-        yield db
\ No newline at end of file
+def to_async_url(url: str) -> str:
+    # Same database, async driver: psycopg2 -> asyncpg, pysqlite -> aiosqlite
+    if url.startswith("postgresql"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+# Set DB_ASYNC=false to serve requests from the sync engine instead (for A/B comparisons)
+DB_ASYNC = os.getenv("DB_ASYNC", "true").lower() == "true"
+
+# Pool settings apply per engine and per worker process: size them so that
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays under the server's max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.wait = Histogram()
+        self.checkout = Histogram()
+        self.timeouts = 0
+
+
+def instrumented_pool(base):
+    """Subclass `base` so every checkout is timed.
+
+    `wait` covers only the time spent queueing for a free connection, `checkout`
+    the whole acquisition including pre-ping. Metrics live on the class so they
+    survive the pool being recreated by engine.dispose().
+    """
+    class InstrumentedPool(base):
+        metrics = PoolMetrics()
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            except sa_exc.TimeoutError:
+                self.metrics.timeouts += 1
+                raise
+            finally:
+                self.metrics.wait.observe((time.perf_counter() - started) * 1000)
+
+        def connect(self):
+            started = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                self.metrics.checkout.observe((time.perf_counter() - started) * 1000)
+
+    return InstrumentedPool
+
+
+def pool_options(url: str, base) -> dict:
+    if ":memory:" in url:
+        return {}
+    return {
+        "poolclass": instrumented_pool(base),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+# The sync engine always exists: the admin views, scheduled jobs and scripts use it.
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, QueuePool))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, AsyncAdaptedQueuePool)) if DB_ASYNC else None
+
+
+def pool_stats() -> dict:
+    stats = {}
+    for name, bind in (("sync", engine), ("async", async_engine)):
+        if bind is None:
+            continue
+        pool = bind.pool
+        entry = {"status": pool.status()}
+        if isinstance(pool, QueuePool):
+            entry.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "timeout_seconds": DB_POOL_TIMEOUT,
+                "recycle_seconds": DB_POOL_RECYCLE,
+                "pre_ping": DB_POOL_PRE_PING,
+            })
+        metrics = getattr(pool, "metrics", None)
+        if metrics is not None:
+            entry.update({
+                "timeouts": metrics.timeouts,
+                "wait_ms": metrics.wait.snapshot(),
+                "checkout_ms": metrics.checkout.snapshot(),
+            })
+        stats[name] = entry
+    return stats
+
+class SyncSessionAdapter:
+    """Gives a blocking Session the awaitable interface of AsyncSession.
+
+    Each database call is pushed to the threadpool, so routes are written once
+    against the async API whichever engine serves them.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    @property
+    def info(self):
+        return self.sync_session.info
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def exec(self, statement, **kwargs):
+        return await run_in_threadpool(partial(self.sync_session.exec, statement, **kwargs))
+
+    async def execute(self, statement, *args, **kwargs):
+        return await run_in_threadpool(partial(self.sync_session.execute, statement, *args, **kwargs))
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(partial(self.sync_session.scalar, statement, *args, **kwargs))
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(partial(self.sync_session.get, entity, ident, **kwargs))
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self, objects=None):
+        await run_in_threadpool(self.sync_session.flush, objects)
+
+    async def refresh(self, instance, attribute_names=None):
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+async def get_db():
+    if DB_ASYNC:
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            yield db
+    else:
+        session = Session(engine, expire_on_commit=False)
+        try:
+            yield SyncSessionAdapter(session)
+        finally:
+            await run_in_threadpool(session.close)
+
+
+async def get_uow(db: AsyncSession = Depends(get_db)):
+    """Unit of work for routes that write: the request's session, committed once.
+
+    Handlers add and flush but never commit. The transaction commits after the
+    handler returns and rolls back if it raises, HTTPException included, so a
+    rejected request leaves nothing behind. Sharing get_db's session keeps the
+    principal and the handler on the same transaction.
+    """
+    try:
+        yield db
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
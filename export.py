@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+import os
+from datetime import date
+from typing import AsyncIterator, List, Sequence
+
+from starlette.concurrency import iterate_in_threadpool
+
+import database
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+async def stream_partitions(statement, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[Sequence]:
+    """Yield the statement's rows `batch_size` at a time from a server-side cursor.
+
+    The export holds its own connection for as long as the response streams,
+    since the request's session is closed before a streaming body is sent.
+    """
+    statement = statement.execution_options(yield_per=batch_size)
+    if database.DB_ASYNC:
+        async with database.async_engine.connect() as connection:
+            result = await connection.stream(statement)
+            async for partition in result.partitions():
+                yield partition
+        return
+
+    def partitions():
+        with database.engine.connect() as connection:
+            yield from connection.execute(statement).partitions()
+
+    async for partition in iterate_in_threadpool(partitions()):
+        yield partition
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ";".join(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+async def encode(partitions: AsyncIterator[Sequence], columns: List[str], fmt: str, transform=None) -> AsyncIterator[str]:
+    """Encode each partition as one chunk of NDJSON lines or CSV rows (CSV starts with a header)."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+    async for partition in partitions:
+        rows = [transform(row) if transform else tuple(row) for row in partition]
+        if fmt == "csv":
+            writer.writerows([_csv_value(value) for value in row] for row in rows)
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            chunk = "".join(json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows)
+        yield chunk
+    if fmt == "csv" and buffer.tell():
+        yield buffer.getvalue()
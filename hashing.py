@@ -1,11 +1,134 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
+from metrics import Histogram
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", "2"))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "16"))
+HASH_TIMEOUT_SECONDS = float(os.getenv("HASH_TIMEOUT_SECONDS", "10"))
+
+
+def _bcrypt(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify(hashed_password: str, plain_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashPool:
+    """Runs password hashing in worker processes behind a bounded queue.
+
+    At most `size + queue_size` jobs are in flight; beyond that callers get a 503
+    straight away instead of piling up behind a login burst. A call still waiting
+    after HASH_TIMEOUT_SECONDS gets the same 503.
+    """
+
+    def __init__(self, size: int, queue_size: int):
+        self.size = size
+        self.queue_size = queue_size
+        self.submitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.latency = Histogram()
+        self._in_flight = 0
+        self._slots = threading.BoundedSemaphore(size + queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily so each uvicorn worker owns its pool; spawn avoids forking a threaded process.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.size, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _busy(self) -> HTTPException:
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, please retry shortly.", headers={"Retry-After": "1"})
+
+    def submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise self._busy()
+        started = time.perf_counter()
+        with self._lock:
+            self.submitted += 1
+            self._in_flight += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release(started)
+            raise
+        future.add_done_callback(lambda _: self._release(started))
+        return future
+
+    def _release(self, started: float):
+        self.latency.observe((time.perf_counter() - started) * 1000)
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _timed_out(self) -> HTTPException:
+        with self._lock:
+            self.timed_out += 1
+        return self._busy()
+
+    def run(self, fn, *args):
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=HASH_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            # Frees the slot now if the call never left the queue
+            future.cancel()
+            raise self._timed_out() from None
+
+    async def run_async(self, fn, *args):
+        # Awaits the worker process without holding a threadpool thread
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self.submit(fn, *args)), HASH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise self._timed_out() from None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            "pool_size": self.size,
+            "queue_size": self.queue_size,
+            "in_flight": in_flight,
+            "queue_depth": max(0, in_flight - self.size),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "latency_ms": self.latency.snapshot(),
+        }
+
+
+hash_pool = HashPool(HASH_POOL_SIZE, HASH_QUEUE_SIZE)
+
 class Hash:
     @staticmethod
     def bcrypt(password: str) -> str:
-        return pwd_context.hash(password)
+        return hash_pool.run(_bcrypt, password)
     @staticmethod
     def verify(hashed_password: str, plain_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+        return hash_pool.run(_verify, hashed_password, plain_password)
+    @staticmethod
+    async def bcrypt_async(password: str) -> str:
+        return await hash_pool.run_async(_bcrypt, password)
+    @staticmethod
+    async def verify_async(hashed_password: str, plain_password: str) -> bool:
+        return await hash_pool.run_async(_verify, hashed_password, plain_password)
@@ -0,0 +1,42 @@
+from sqlalchemy import func, select, update
+
+from models import Book, Loan
+
+# Each change is a single conditional UPDATE: the availability guard and the new
+# counts are evaluated by the database against the row as it is at write time, so
+# concurrent checkouts of the last copy cannot both succeed and counts never go
+# negative. RETURNING gives the new counts, or no row when the guard failed.
+#
+# Both also refresh Book.next_available_on, the earliest due date among the
+# book's copies on rent (NULL when none are out). Run them after the loan rows
+# themselves have changed in the same transaction, so the subquery sees them.
+#
+# Search results are cached with these columns in them: callers must also call
+# catalog_cache.mark_changed(db) so the cache is invalidated when they commit.
+
+
+def next_due_date():
+    # Served by the partial index on open loans (borrowed_book_id, due_date)
+    return (select(func.min(Loan.due_date))
+            .where(Loan.borrowed_book_id == Book.id, Loan.returned == False, Loan.loan_approved == True)
+            .scalar_subquery())
+
+
+def checkout(book_id: int, copies: int = 1):
+    """Move `copies` copies of a book from the shelf to on-rent, if that many are available."""
+    return (update(Book)
+            .where(Book.id == book_id, Book.copies_available >= copies)
+            .values(copies_available=Book.copies_available - copies,
+                    copies_on_rent=Book.copies_on_rent + copies,
+                    next_available_on=next_due_date())
+            .returning(Book.copies_available, Book.copies_on_rent, Book.next_available_on))
+
+
+def checkin(book_id: int, copies: int = 1):
+    """Move `copies` copies of a book from on-rent back to the shelf."""
+    return (update(Book)
+            .where(Book.id == book_id, Book.copies_on_rent >= copies)
+            .values(copies_available=Book.copies_available + copies,
+                    copies_on_rent=Book.copies_on_rent - copies,
+                    next_available_on=next_due_date())
+            .returning(Book.copies_available, Book.copies_on_rent, Book.next_available_on))
@@ -0,0 +1,149 @@
+import os
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, delete, insert, literal, or_, update
+from sqlmodel import Session, select
+
+import loan_sweep, notify, pagination
+from models import (BroadcastNotification, BroadcastNotificationArchive, BroadcastReceipt, Loan, Notification,
+                    NotificationArchive)
+
+DUE_REMINDER_DAYS = int(os.getenv("DUE_REMINDER_DAYS", "2"))
+# Read and unread notifications older than these move to the archive; 0 keeps unread ones live
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+NOTIFICATION_UNREAD_RETENTION_DAYS = int(os.getenv("NOTIFICATION_UNREAD_RETENTION_DAYS", "365"))
+# Broadcasts (and their read receipts) older than this move to the archive; 0 keeps them live
+NOTIFICATION_BROADCAST_RETENTION_DAYS = int(os.getenv("NOTIFICATION_BROADCAST_RETENTION_DAYS", "365"))
+# Archived notifications older than this are deleted; 0 keeps them
+NOTIFICATION_ARCHIVE_RETENTION_DAYS = int(os.getenv("NOTIFICATION_ARCHIVE_RETENTION_DAYS", "0"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "1000"))
+
+
+def overdue_sweep(db: Session) -> int:
+    return loan_sweep.sweep_overdue_loans(db).rows_touched
+
+
+def due_reminders(db: Session) -> int:
+    # Remind borrowers once per due date; a changed due date gets a fresh reminder.
+    today = date.today()
+    horizon = today + timedelta(days=DUE_REMINDER_DAYS)
+    sent = 0
+    last_id = 0
+    while True:
+        loans = db.exec(
+            select(Loan.id, Loan.borrower_id, Loan.borrowed_book_id, Loan.due_date)
+            .where(Loan.loan_approved == True,
+                   Loan.returned == False,
+                   Loan.due_date >= today,
+                   Loan.due_date <= horizon,
+                   (Loan.reminder_sent_for == None) | (Loan.reminder_sent_for != Loan.due_date),
+                   Loan.id > last_id)
+            .order_by(Loan.id)
+            .limit(JOB_BATCH_SIZE)
+        ).all()
+        if not loans:
+            break
+
+        notify.notify_users(db, [
+            (borrower_id, f"Reminder: Book ID {book_id} on Loan ID {loan_id} is due on {due_date}. Please return it on time to avoid fine.")
+            for loan_id, borrower_id, book_id, due_date in loans
+        ])
+        db.execute(
+            update(Loan)
+            .where(Loan.id.in_([loan_id for loan_id, _, _, _ in loans]))
+            .values(reminder_sent_for=Loan.due_date)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+        sent += len(loans)
+        last_id = loans[-1][0]
+    return sent
+
+
+ARCHIVED_COLUMNS = ["id", "user_id", "message", "is_read", "created_at"]
+ARCHIVED_BROADCAST_COLUMNS = ["id", "role", "message", "created_at"]
+
+
+def notification_archive(db: Session) -> int:
+    # Expired notifications are copied to the archive and deleted in the same short
+    # transaction, one batch at a time, oldest first.
+    now = datetime.utcnow()
+    read_cutoff = now - timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    expired = and_(Notification.is_read == True, Notification.created_at < read_cutoff)
+    horizon = read_cutoff
+    if NOTIFICATION_UNREAD_RETENTION_DAYS:
+        unread_cutoff = now - timedelta(days=NOTIFICATION_UNREAD_RETENTION_DAYS)
+        expired = or_(expired, and_(Notification.is_read == False, Notification.created_at < unread_cutoff))
+        horizon = max(read_cutoff, unread_cutoff)
+
+    moved = archive_batches(db, Notification, NotificationArchive, ARCHIVED_COLUMNS,
+                            and_(Notification.created_at < horizon, expired), now)
+    if NOTIFICATION_BROADCAST_RETENTION_DAYS:
+        # A broadcast's read state is per user, so it expires by age alone; its receipts go with it
+        broadcast_cutoff = now - timedelta(days=NOTIFICATION_BROADCAST_RETENTION_DAYS)
+        moved += archive_batches(db, BroadcastNotification, BroadcastNotificationArchive, ARCHIVED_BROADCAST_COLUMNS,
+                                 BroadcastNotification.created_at < broadcast_cutoff, now,
+                                 dependents=[BroadcastReceipt.broadcast_id])
+
+    if NOTIFICATION_ARCHIVE_RETENTION_DAYS:
+        archive_cutoff = now - timedelta(days=NOTIFICATION_ARCHIVE_RETENTION_DAYS)
+        moved += purge_archive(db, NotificationArchive, archive_cutoff)
+        moved += purge_archive(db, BroadcastNotificationArchive, archive_cutoff)
+    return moved
+
+
+def archive_batches(db: Session, model, archive, columns, expired, now: datetime, dependents=()) -> int:
+    """Move the rows of `model` matching `expired` into `archive`, oldest first.
+
+    Each batch is copied, stripped of its `dependents` (foreign key columns of rows
+    that only describe it) and deleted in one short transaction.
+    """
+    moved = 0
+    after = None
+    while True:
+        # Rows locked by a concurrent mark-as-read are skipped and left for the next run
+        statement = (select(model.created_at, model.id)
+                     .where(expired)
+                     .order_by(model.created_at, model.id)
+                     .limit(JOB_BATCH_SIZE)
+                     .with_for_update(skip_locked=True))
+        if after is not None:
+            statement = statement.where(pagination.keyset_after(
+                [(model.created_at, False), (model.id, False)], after))
+        rows = db.exec(statement).all()
+        if not rows:
+            break
+
+        ids = [row_id for _, row_id in rows]
+        db.execute(
+            insert(archive)
+            .from_select(columns + ["archived_at"],
+                         select(*[getattr(model, column) for column in columns], literal(now))
+                         .where(model.id.in_(ids)))
+        )
+        for column in dependents:
+            db.execute(delete(column.table).where(column.in_(ids)))
+        db.execute(delete(model).where(model.id.in_(ids)))
+        db.commit()
+
+        moved += len(ids)
+        after = tuple(rows[-1])
+    return moved
+
+
+def purge_archive(db: Session, archive, cutoff: datetime) -> int:
+    deleted = 0
+    while True:
+        ids = db.exec(
+            select(archive.id)
+            .where(archive.created_at < cutoff)
+            .order_by(archive.created_at)
+            .limit(JOB_BATCH_SIZE)
+        ).all()
+        if not ids:
+            break
+        db.execute(delete(archive).where(archive.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+    return deleted
@@ -0,0 +1,195 @@
+import logging
+import os
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import case, or_, update
+from sqlmodel import Session, select
+
+import catalog_cache, inventory, notify
+from loan_sweep import days_overdue
+from models import FINE_PER_DAY, Book, Loan, LoanApprovalRequest, LoanBatchResult
+
+LOAN_BATCH_MAX = int(os.getenv("LOAN_BATCH_MAX", "500"))
+
+
+def _failed(loan_id: Optional[int], status_code: int, detail: str, book_id: Optional[int] = None) -> LoanBatchResult:
+    return LoanBatchResult(loan_id=loan_id, book_id=book_id, ok=False, status_code=status_code, detail=detail)
+
+
+def settled_fine(dialect_name: str, today: date) -> dict:
+    """UPDATE values giving a loan returned `today` its final fine, as Loan.return_book() does."""
+    late = Loan.due_date < today
+    return {
+        "overdue": case((late, True), else_=False),
+        "fine": case((late, days_overdue(dialect_name, today) * FINE_PER_DAY), else_=0),
+    }
+
+
+def approve_loans(db: Session, requests: List[LoanApprovalRequest]) -> List[LoanBatchResult]:
+    """Approve a batch of loans in one transaction, leaving the commit to the caller.
+
+    The loans and their books are read (and locked, where the database supports
+    it) in one query each; copies are handed out per book in request order, each
+    book's count changes with one conditional UPDATE, the loans with one UPDATE
+    and the borrowers' notifications with one multi-row INSERT.
+    """
+    results: Dict[int, LoanBatchResult] = {}
+    wanted: Dict[int, LoanApprovalRequest] = {}
+    for request in requests:
+        if request.loan_id in wanted or request.loan_id in results:
+            results[request.loan_id] = _failed(request.loan_id, 400, "Loan ID appears more than once in the batch.")
+            wanted.pop(request.loan_id, None)
+        else:
+            wanted[request.loan_id] = request
+
+    loans = {loan.id: loan for loan in db.exec(
+        select(Loan.id, Loan.borrower_id, Loan.borrowed_book_id, Loan.issue_date, Loan.loan_approved, Loan.returned)
+        .where(Loan.id.in_(list(wanted)))
+        .with_for_update()
+    ).all()}
+
+    today = date.today()
+    candidates = defaultdict(list)
+    for loan_id, request in wanted.items():
+        loan = loans.get(loan_id)
+        if loan is None:
+            results[loan_id] = _failed(loan_id, 404, "Loan not found.")
+        elif loan.loan_approved:
+            results[loan_id] = _failed(loan_id, 400, "Loan is already approved.")
+        elif loan.returned:
+            results[loan_id] = _failed(loan_id, 400, "Loan has already been canceled or returned.")
+        elif request.due_date and request.due_date < loan.issue_date:
+            results[loan_id] = _failed(loan_id, 400, "Due date cannot be before the issue date.")
+        elif request.due_date and request.due_date < today:
+            results[loan_id] = _failed(loan_id, 400, "Due date cannot be in the past.")
+        else:
+            candidates[loan.borrowed_book_id].append(loan_id)
+
+    available = dict(db.exec(
+        select(Book.id, Book.copies_available).where(Book.id.in_(list(candidates))).with_for_update()
+    ).all())
+    granted = []
+    for book_id, loan_ids in candidates.items():
+        copies = max(available.get(book_id) or 0, 0)
+        granted.extend(loan_ids[:copies])
+        for loan_id in loan_ids[copies:]:
+            results[loan_id] = _failed(loan_id, 409, f"No copies of book ID {book_id} are available.")
+
+    if granted:
+        due_dates = {loan_id: wanted[loan_id].due_date for loan_id in granted if wanted[loan_id].due_date}
+        due_date = case(due_dates, value=Loan.id, else_=Loan.due_date) if due_dates else Loan.due_date
+        claimed = db.exec(
+            update(Loan)
+            .where(Loan.id.in_(granted), Loan.loan_approved == False, Loan.returned == False)
+            .values(loan_approved=True, due_date=due_date)
+            .returning(Loan.id, Loan.due_date)
+            .execution_options(synchronize_session=False)
+        ).all()
+        claimed = dict(claimed)
+        for loan_id in granted:
+            if loan_id not in claimed:
+                results[loan_id] = _failed(loan_id, 400, "Loan is already approved.")
+
+        per_book = defaultdict(int)
+        for loan_id in claimed:
+            per_book[loans[loan_id].borrowed_book_id] += 1
+        for book_id, copies in per_book.items():
+            if db.exec(inventory.checkout(book_id, copies)).first() is None:
+                # Only reachable where the rows could not be locked above and another request took the copies
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Copies of book ID {book_id} changed during the batch; please retry.")
+        if per_book:
+            catalog_cache.mark_changed(db)
+
+        notify.notify_users(db, [
+            (loans[loan_id].borrower_id,
+             f"Your loan request for book ID {loans[loan_id].borrowed_book_id} has been approved. Please make sure you return the book by {due} to avoid fine.")
+            for loan_id, due in claimed.items()
+        ])
+        for loan_id, due in claimed.items():
+            results[loan_id] = LoanBatchResult(loan_id=loan_id, ok=True, status_code=200, detail="Loan approved successfully.", due_date=due)
+
+    return [results[loan_id] for loan_id in dict.fromkeys(request.loan_id for request in requests)]
+
+
+def return_loans(db: Session, loan_ids: List[int], borrower_id: Optional[int] = None,
+                 book_ids: List[int] = (), today: Optional[date] = None) -> List[LoanBatchResult]:
+    """Check in a batch of loans in one transaction, leaving the commit to the caller.
+
+    Loans are named by id, or by book id for one borrower (their open loan of
+    that book). The loans are closed with their final fines in one UPDATE,
+    copies go back on the shelf with one UPDATE per book, and the borrowers'
+    notifications are written with one multi-row INSERT.
+    """
+    today = today or date.today()
+    conditions = [Loan.id.in_(list(loan_ids))]
+    if borrower_id is not None and book_ids:
+        conditions.append((Loan.borrower_id == borrower_id) & Loan.borrowed_book_id.in_(list(book_ids))
+                          & (Loan.loan_approved == True) & (Loan.returned == False))
+    rows = db.exec(
+        select(Loan.id, Loan.borrower_id, Loan.borrowed_book_id, Loan.loan_approved, Loan.returned)
+        .where(or_(*conditions))
+        .order_by(Loan.id)
+        .with_for_update()
+    ).all()
+    loans = {row.id: row for row in rows}
+    open_loan_for_book = {}
+    named = set(loan_ids)
+    for row in rows:
+        if row.borrower_id == borrower_id and row.loan_approved and not row.returned and row.id not in named:
+            open_loan_for_book.setdefault(row.borrowed_book_id, row.id)
+
+    # (loan id, book id as requested) per requested item, in request order
+    items = [(loan_id, None) for loan_id in loan_ids] + [(open_loan_for_book.get(book_id), book_id) for book_id in book_ids]
+    results: List[Optional[LoanBatchResult]] = [None] * len(items)
+    pending: Dict[int, int] = {}
+    for index, (loan_id, book_id) in enumerate(items):
+        loan = loans.get(loan_id)
+        if loan_id is None:
+            results[index] = _failed(None, 404, f"No open loan of book ID {book_id} for this borrower.", book_id)
+        elif loan is None:
+            results[index] = _failed(loan_id, 404, "Loan not found.")
+        elif loan_id in pending:
+            results[index] = _failed(loan_id, 400, "Loan appears more than once in the batch.", book_id)
+        elif not loan.loan_approved or loan.returned:
+            results[index] = _failed(loan_id, 400, "Loan is not approved or has already been returned.", book_id)
+        else:
+            pending[loan_id] = index
+
+    if pending:
+        closed = db.exec(
+            update(Loan)
+            .where(Loan.id.in_(list(pending)), Loan.loan_approved == True, Loan.returned == False)
+            .values(returned=True, return_accepted=True, **settled_fine(db.get_bind().dialect.name, today))
+            .returning(Loan.id, Loan.fine)
+            .execution_options(synchronize_session=False)
+        ).all()
+        fines = dict(closed)
+
+        per_book = defaultdict(int)
+        for loan_id in fines:
+            per_book[loans[loan_id].borrowed_book_id] += 1
+        for book_id, copies in per_book.items():
+            if db.exec(inventory.checkin(book_id, copies)).first() is None:
+                # The returns still stand; a missing book or short on-rent count is a data problem to look into
+                logging.warning("Returned %s loans of book %s but it had fewer copies on rent", copies, book_id)
+        if per_book:
+            catalog_cache.mark_changed(db)
+
+        notify.notify_users(db, [
+            (loans[loan_id].borrower_id,
+             f"Book ID {loans[loan_id].borrowed_book_id} has been returned successfully."
+             + (f" A fine of {fine} is due for the late return." if fine else ""))
+            for loan_id, fine in fines.items()
+        ])
+        for loan_id, index in pending.items():
+            book_id = items[index][1]
+            if loan_id in fines:
+                results[index] = LoanBatchResult(loan_id=loan_id, book_id=book_id, ok=True, status_code=200,
+                                                 detail="Book returned successfully.", fine=fines[loan_id])
+            else:
+                results[index] = _failed(loan_id, 400, "Loan is not approved or has already been returned.", book_id)
+
+    return results
@@ -1,24 +1,42 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException,status
 from fastapi.security import OAuth2PasswordRequestForm
-import database,models,JWTtoken,hashing
-from sqlmodel import Session,select
+import database,models,JWTtoken,hashing,notification_hub,notification_outbox,scheduler
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import timedelta
-from routers import user_route, book_route, author_route, loan_route,notifaction_route
+from routers import user_route, book_route, author_route, loan_route,notifaction_route,metrics_route,export_route
 from starlette_admin.contrib.sqla import Admin, ModelView
 import inspect
 from models import User
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Recurring loan maintenance runs inside every worker; job leases keep it single-run.
+    if scheduler.SCHEDULER_ENABLED:
+        scheduler.scheduler.start()
+    await notification_hub.hub.start()
+    await notification_outbox.dispatcher.start()
+    yield
+    await notification_outbox.dispatcher.stop()
+    await notification_hub.hub.stop()
+    await scheduler.scheduler.stop()
+    hashing.hash_pool.shutdown()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+    database.engine.dispose()
 
-database.init_db()
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(user_route.router)
 app.include_router(notifaction_route.router)
 app.include_router(loan_route.router)
 app.include_router(book_route.router)
 app.include_router(author_route.router)
+app.include_router(metrics_route.router)
+app.include_router(export_route.router)
 
-classlist = ["AuthorDetails", "LoanDetails", "UserDetails","UserRole","BookCreate","AuthorCreate","AuthorUpdate","LoanApprovalRequest","LoanCancellationRequest","LoanReturnRequest","Login","Token","TokenData"]
+classlist = ["AuthorDetails", "LoanDetails", "UserDetails","UserRole","BookCreate","AuthorCreate","AuthorUpdate","LoanApprovalRequest","LoanBatchApprovalRequest","LoanBatchReturnRequest","LoanBatchResult","LoanCancellationRequest","LoanReturnRequest","Login","Token","TokenData","NotificationDetails","BookSearchResult"]
 def create_admin_view(app):
     # Create admin
     admin = Admin(database.engine, title="Library Management System")
@@ -41,22 +59,22 @@ def create_admin_view(app):
 create_admin_view(app)
 
 @app.get('/')
-def index():
+async def index():
     return {"Success"}
 
 @app.post('/login')
-def login(request: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.exec(select(User).where(User.email == request.username)).first()
+async def login(request: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_db)):
+    user = (await db.exec(select(User).where(User.email == request.username))).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Invalid Credential! User with {request.username} does not exist.")
 
-    if not hashing.Hash.verify(user.password, request.password):
+    if not await hashing.Hash.verify_async(user.password, request.password):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Incorrect Password.")
 
     access_token_expires = timedelta(minutes=JWTtoken.ACCESS_TOKEN_EXPIRE_MINUTES)
-    # Include the role in the token data
+    # Include the role and user id in the token data
     access_token = JWTtoken.create_access_token(
-        data={"sub": user.email, "role": user.role}, 
+        data={"sub": user.email, "role": user.role, "uid": user.id}, 
         expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
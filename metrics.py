@@ -0,0 +1,41 @@
+import threading
+from typing import Sequence
+
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """Cumulative latency histogram in milliseconds, safe to observe from any thread."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms: float):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value_ms <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+            self._sum += value_ms
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets, counts):
+            running += n
+            cumulative[f"le_{bound}"] = running
+        cumulative["le_inf"] = count
+        return {
+            "count": count,
+            "avg_ms": round(total / count, 3) if count else None,
+            "buckets": cumulative,
+        }
@@ -1,11 +1,15 @@
 from datetime import datetime, timedelta, date
 from typing import Optional, List
+from sqlalchemy import DDL, Index, event, false, func, literal, text
 from sqlmodel import SQLModel, Field, Relationship
 from pydantic import BaseModel, EmailStr
 
+FINE_PER_DAY = 10
+
 class BookAuthorAssociation(SQLModel, table=True):
     book_id: Optional[int] = Field(foreign_key='book.id', primary_key=True, nullable=True)
-    author_id: Optional[int] = Field(foreign_key='author.id', primary_key=True, nullable=True)
+    # The primary key leads with book_id, so lookups by author need their own index
+    author_id: Optional[int] = Field(foreign_key='author.id', primary_key=True, nullable=True, index=True)
 
 class Book(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -25,6 +29,37 @@ class Author(SQLModel, table=True):
     email: str = Field(nullable=False, unique=True)
     books: List["Book"] = Relationship(back_populates='authors', link_model=BookAuthorAssociation)
 
+# Catalog search indexes (PostgreSQL only): trigram GIN indexes let ILIKE '%term%'
+# and similarity() use an index, and the tsvector GIN index serves full-text queries.
+event.listen(SQLModel.metadata, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+
+def book_search_document():
+    # Must match the indexed expression exactly for the planner to use ix_book_search_document,
+    # so the constants are inlined rather than sent as bind parameters.
+    empty, space = literal("", literal_execute=True), literal(" ", literal_execute=True)
+    return func.to_tsvector(text("'simple'::regconfig"),
+                            func.coalesce(Book.__table__.c.title, empty) + space + func.coalesce(Book.__table__.c.genre, empty))
+
+Index("ix_book_title_trgm", Book.__table__.c.title,
+      postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+Index("ix_book_genre_trgm", Book.__table__.c.genre,
+      postgresql_using="gin", postgresql_ops={"genre": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+Index("ix_book_search_document", book_search_document(), postgresql_using="gin").ddl_if(dialect="postgresql")
+Index("ix_author_pen_name_trgm", Author.__table__.c.pen_name,
+      postgresql_using="gin", postgresql_ops={"pen_name": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+
+class BookSearchResult(BaseModel):
+    id: int
+    title: str
+    genre: Optional[str] = None
+    pages: Optional[int] = None
+    total_copies: int
+    copies_available: Optional[int] = None
+    copies_on_rent: int
+    next_available_on: Optional[date] = None
+    authors: List[str] = []
+
 class AuthorDetails(BaseModel):
     pen_name: str
     email: EmailStr
@@ -40,7 +75,11 @@ class User(SQLModel, table=True):
     last_name: str = Field(nullable=False, index=True)
     email: str = Field(nullable=False, unique=True)
     password: str = Field(nullable=False)
-    role: str = Field(default='Member', nullable=False)
+    role: str = Field(default='Member', nullable=False, index=True)
+    # Broadcasts sent before this are not shown to the user
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    # Broadcasts at or below this id count as read; moved up by the bulk mark-read
+    last_read_broadcast_id: int = Field(default=0, nullable=False)
     loans: List["Loan"] = Relationship(back_populates='borrower', sa_relationship_kwargs={"cascade": "all, delete-orphan"})
 
 class Loan(SQLModel, table=True):
@@ -59,6 +98,7 @@ class Loan(SQLModel, table=True):
     return_accepted: Optional[bool] = Field(default=False)
     cancel_requested: Optional[bool] = Field(default=False)
     cancel_accepted: Optional[bool] = Field(default=False)
+    reminder_sent_for: Optional[date] = Field(default=None)
 
     borrower: User = Relationship(back_populates='loans')
     borrowed_book: Book = Relationship(back_populates='loans')
@@ -73,14 +113,15 @@ class Loan(SQLModel, table=True):
         if not self.returned and date.today() > self.due_date:
             self.overdue = True
             days_overdue = (date.today() - self.due_date).days
-            self.fine = days_overdue * 10
+            self.fine = days_overdue * FINE_PER_DAY
         else:
             self.overdue = False
             self.fine = 0
 
     def return_book(self):
-        self.returned = True
+        # Settle the fine while the loan is still open; check_overdue() clears it on returned loans
         self.check_overdue()
+        self.returned = True
 
 class LoanDetails(BaseModel):
     loan_id: int
@@ -97,6 +138,7 @@ class UserDetails(BaseModel):
     last_name: str
     email: EmailStr
     loans: List[LoanDetails]
+    next_cursor: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -121,6 +163,23 @@ class LoanApprovalRequest(BaseModel):
     loan_id: int
     due_date: Optional[date] = None
 
+class LoanBatchApprovalRequest(BaseModel):
+    loans: List[LoanApprovalRequest]
+
+class LoanBatchReturnRequest(BaseModel):
+    loan_ids: List[int] = []
+    borrower_id: Optional[int] = None
+    book_ids: List[int] = []
+
+class LoanBatchResult(BaseModel):
+    loan_id: Optional[int] = None
+    book_id: Optional[int] = None
+    ok: bool
+    status_code: int
+    detail: str
+    due_date: Optional[date] = None
+    fine: Optional[int] = None
+
 class LoanCancellationRequest(BaseModel):
     loan_id: int
 
@@ -128,12 +187,90 @@ class LoanReturnRequest(BaseModel):
     loan_id: int
 
 class Notification(SQLModel, table=True):
+    # Archived ids must never be handed out again, which SQLite only promises with AUTOINCREMENT
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int
     message: str
     is_read: bool = Field(default=False)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Indexes for the hot paths; keep in step with the migrations in alembic/versions.
+# Notifications and loan history are read newest first, one keyset page at a time.
+Index("ix_notification_user_id_created_at", Notification.user_id, Notification.created_at, Notification.id)
+# Partial: unread badges count a user's unread rows without touching the table
+Index("ix_notification_unread_user_id", Notification.user_id,
+      postgresql_where=Notification.is_read == false(), sqlite_where=Notification.is_read == false())
+# The archival job walks notifications oldest first
+Index("ix_notification_created_at_id", Notification.created_at, Notification.id)
+Index("ix_loan_borrower_id_issue_date", Loan.borrower_id, Loan.issue_date, Loan.id)
+Index("ix_loan_borrower_id_returned", Loan.borrower_id, Loan.returned)
+# Partial: only open loans are looked up by book (availability, next due date)
+Index("ix_loan_open_borrowed_book_id_due_date", Loan.borrowed_book_id, Loan.due_date,
+      postgresql_where=Loan.returned == false(), sqlite_where=Loan.returned == false())
+
+class NotificationOutbox(SQLModel, table=True):
+    # Notifications recorded with the change that caused them, written out in batches by
+    # notification_outbox; user_id is set for a personal notification, role for a broadcast
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: Optional[int] = Field(default=None)
+    role: Optional[str] = Field(default=None)
+    message: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class NotificationArchive(SQLModel, table=True):
+    # Notifications moved out of the live table once past their retention window; ids are kept
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    user_id: int = Field(nullable=False, index=True)
+    message: str
+    is_read: bool = Field(nullable=False)
+    created_at: datetime = Field(nullable=False, index=True)
+    archived_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+class BroadcastNotification(SQLModel, table=True):
+    # Archived ids must never be handed out again, which SQLite only promises with AUTOINCREMENT
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    role: str = Field(nullable=False, index=True)
+    message: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# The archival job walks broadcasts oldest first
+Index("ix_broadcastnotification_created_at_id", BroadcastNotification.created_at, BroadcastNotification.id)
+# Unread counts only read a role's broadcasts above the user's read watermark
+Index("ix_broadcastnotification_role_id", BroadcastNotification.role, BroadcastNotification.id)
+
+class BroadcastReceipt(SQLModel, table=True):
+    broadcast_id: int = Field(foreign_key='broadcastnotification.id', primary_key=True)
+    user_id: int = Field(foreign_key='user.id', primary_key=True)
+    read_at: datetime = Field(default_factory=datetime.utcnow)
+
+class BroadcastNotificationArchive(SQLModel, table=True):
+    # Broadcasts moved out once past NOTIFICATION_BROADCAST_RETENTION_DAYS; receipts are not kept
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    role: str = Field(nullable=False, index=True)
+    message: str
+    created_at: datetime = Field(nullable=False, index=True)
+    archived_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+class NotificationDetails(BaseModel):
+    id: int
+    user_id: int
+    message: str
+    is_read: bool
+    created_at: datetime
+    broadcast: bool = False
+
+class JobLease(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    leased_until: datetime = Field(nullable=False)
+    last_started_at: Optional[datetime] = Field(default=None)
+    last_duration_ms: Optional[float] = Field(default=None)
+    last_rows: Optional[int] = Field(default=None)
+    last_error: Optional[str] = Field(default=None)
+
 class Login(BaseModel):
     email: str
     password: str
@@ -144,4 +281,5 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: str
-    role: str
\ No newline at end of file
+    role: str
+    id: Optional[int] = None
\ No newline at end of file
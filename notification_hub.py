@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, text
+from sqlmodel import Session
+
+import database
+from models import BroadcastNotification, Notification
+
+# "postgres" fans committed notifications out to every worker through LISTEN/NOTIFY,
+# "local" only reaches subscribers of the worker that wrote them.
+PUSH_FANOUT = os.getenv("NOTIFICATION_PUSH_FANOUT", "postgres" if database.DATABASE_URL.startswith("postgresql") else "local")
+PUSH_CHANNEL = os.getenv("NOTIFICATION_PUSH_CHANNEL", "library_notifications")
+PUSH_QUEUE_SIZE = int(os.getenv("NOTIFICATION_PUSH_QUEUE_SIZE", "100"))
+PUSH_HEARTBEAT_SECONDS = float(os.getenv("NOTIFICATION_PUSH_HEARTBEAT_SECONDS", "25"))
+PUSH_RECONNECT_SECONDS = float(os.getenv("NOTIFICATION_PUSH_RECONNECT_SECONDS", "2"))
+PENDING_KEY = "pushed_notifications"
+EVENTS_KEY = "pushed_events"
+# NOTIFY payloads are limited to 8000 bytes; longer messages are left for the pull endpoint
+MAX_PAYLOAD = 7900
+
+
+def event_for(item) -> dict:
+    """Wire form of a committed notification, shaped like NotificationDetails."""
+    if isinstance(item, BroadcastNotification):
+        event = {"id": item.id, "role": item.role, "message": item.message, "created_at": item.created_at, "broadcast": True}
+    elif isinstance(item, Notification):
+        event = {"id": item.id, "user_id": item.user_id, "message": item.message, "created_at": item.created_at, "broadcast": False}
+    else:
+        event = {**item, "broadcast": "role" in item}
+    created_at = event["created_at"]
+    return {"type": "notification", **event, "is_read": False,
+            "created_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at}
+
+
+def payload_for(event: dict) -> str:
+    payload = json.dumps(event)
+    if len(payload.encode()) > MAX_PAYLOAD:
+        payload = json.dumps({**event, "message": None, "truncated": True})
+    return payload
+
+
+class Subscription:
+    """One connected client: a bounded queue of events for its user and role."""
+
+    def __init__(self, user_id: int, role: str, size: int = PUSH_QUEUE_SIZE):
+        self.user_id = user_id
+        self.role = role
+        self.queue = asyncio.Queue(size)
+        self.dropped = 0
+
+    def offer(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client this far behind re-reads GET /notifications instead
+            self.dropped += self.queue.qsize() + 1
+            self.resync()
+
+    def resync(self):
+        """Replace whatever is queued with one {"type": "resync"}: the client should pull to catch up."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait({"type": "resync"})
+
+    async def next(self, timeout: float = PUSH_HEARTBEAT_SECONDS) -> Optional[dict]:
+        """The next event, or None once `timeout` passes idle."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class NotificationHub:
+    """In-process pub/sub for committed notifications.
+
+    Subscribers live on the event loop. Publishing is safe from any thread, since
+    commits may run in the threadpool. With the postgres fan-out every worker
+    (this one included) learns of commits through one LISTEN connection, so
+    nothing is delivered locally at commit time.
+    """
+
+    def __init__(self, fanout: str = PUSH_FANOUT):
+        self.fanout = fanout
+        self.users = defaultdict(set)
+        self.roles = defaultdict(set)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.listener: Optional[asyncio.Task] = None
+        self.listening = False
+        self.published = 0
+        self.delivered = 0
+        self.reconnects = 0
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self.users.values())
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int, role: str):
+        self.loop = self.loop or asyncio.get_running_loop()
+        subscription = Subscription(user_id, role)
+        self.users[user_id].add(subscription)
+        self.roles[role].add(subscription)
+        try:
+            yield subscription
+        finally:
+            for index, key in ((self.users, user_id), (self.roles, role)):
+                index[key].discard(subscription)
+                if not index[key]:
+                    del index[key]
+
+    def deliver(self, event: dict):
+        # Runs on the event loop
+        if event.get("broadcast"):
+            for subscription in list(self.roles.get(event["role"], ())):
+                subscription.offer({**event, "user_id": subscription.user_id})
+                self.delivered += 1
+        else:
+            for subscription in list(self.users.get(event["user_id"], ())):
+                subscription.offer(event)
+                self.delivered += 1
+
+    def publish(self, events):
+        # Local fan-out; callable from any thread
+        self.published += len(events)
+        if self.loop is None or self.loop.is_closed():
+            return
+        for item in events:
+            self.loop.call_soon_threadsafe(self.deliver, item)
+
+    def resync_all(self):
+        for subscriptions in self.users.values():
+            for subscription in subscriptions:
+                subscription.resync()
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        if self.fanout == "postgres":
+            self.listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+            self.listener = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.deliver(json.loads(payload))
+
+    async def _listen(self):
+        import asyncpg
+        dsn = "postgresql://" + database.DATABASE_URL.split("://", 1)[1]
+        while True:
+            try:
+                connection = await asyncpg.connect(dsn)
+                try:
+                    lost = asyncio.Event()
+                    connection.add_termination_listener(lambda _: lost.set())
+                    await connection.add_listener(PUSH_CHANNEL, self._on_notify)
+                    if self.reconnects:
+                        # Anything committed while we were away was missed; clients catch up by pulling
+                        self.resync_all()
+                    self.listening = True
+                    await lost.wait()
+                    logging.warning("Notification listener connection lost; reconnecting")
+                finally:
+                    self.listening = False
+                    if not connection.is_closed():
+                        await connection.close()
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logging.warning("Notification listener failed: %s; reconnecting", e)
+            self.reconnects += 1
+            await asyncio.sleep(PUSH_RECONNECT_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "fanout": self.fanout,
+            "listening": self.listening,
+            "subscribers": self.subscribers,
+            "users": len(self.users),
+            "published": self.published,
+            "delivered": self.delivered,
+            "reconnects": self.reconnects,
+            "dropped": sum(subscription.dropped for subscriptions in self.users.values() for subscription in subscriptions),
+        }
+
+
+hub = NotificationHub()
+
+
+def track(db, item):
+    """Queue a notification written in this session for push once the transaction commits."""
+    db.info.setdefault(PENDING_KEY, []).append(item)
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_before_commit(session):
+    items = session.info.pop(PENDING_KEY, None)
+    if not items:
+        return
+    session.flush()
+    events = session.info[EVENTS_KEY] = [event_for(item) for item in items]
+    if hub.fanout == "postgres" and session.get_bind().dialect.name == "postgresql":
+        # NOTIFY is transactional: listeners hear of the rows only if and when they commit
+        session.execute(text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+                        {"channel": PUSH_CHANNEL, "payloads": [payload_for(event) for event in events]})
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    events = session.info.pop(EVENTS_KEY, None)
+    if not events:
+        return
+    if hub.fanout == "postgres":
+        hub.published += len(events)
+    else:
+        hub.publish(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+    session.info.pop(EVENTS_KEY, None)
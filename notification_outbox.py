@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import delete, event, insert
+from sqlmodel import Session, select
+
+import database
+from models import BroadcastNotification, Notification, NotificationOutbox
+from notification_hub import track
+
+OUTBOX_BATCH_SIZE = int(os.getenv("NOTIFICATION_OUTBOX_BATCH_SIZE", "500"))
+# Rows enqueued by other workers are picked up within this many seconds even without a wake-up
+OUTBOX_POLL_SECONDS = float(os.getenv("NOTIFICATION_OUTBOX_POLL_SECONDS", "5"))
+ENQUEUED_KEY = "outbox_enqueued"
+
+
+def enqueued(db):
+    """Mark the session as having written outbox rows, so its commit wakes the dispatcher."""
+    db.info[ENQUEUED_KEY] = True
+
+
+def dispatch(db: Session, limit: int = OUTBOX_BATCH_SIZE) -> int:
+    """Move up to `limit` outbox rows into the notification tables; returns how many moved.
+
+    Claiming (DELETE ... RETURNING) and writing happen in one transaction: if anything
+    fails the rows stay in the outbox and the next pass retries them. On PostgreSQL
+    rows claimed by another worker are skipped rather than waited for.
+    """
+    claim = (select(NotificationOutbox.id)
+             .order_by(NotificationOutbox.id)
+             .limit(limit)
+             .with_for_update(skip_locked=True))
+    rows = db.execute(
+        delete(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(claim))
+        .returning(NotificationOutbox.id, NotificationOutbox.user_id, NotificationOutbox.role,
+                   NotificationOutbox.message, NotificationOutbox.created_at)
+    ).all()
+    if not rows:
+        db.rollback()
+        return 0
+
+    # Written in the order they were enqueued, one multi-row INSERT per table
+    rows.sort(key=lambda row: row.id)
+    personal = [{"user_id": row.user_id, "message": row.message, "is_read": False, "created_at": row.created_at}
+                for row in rows if row.user_id is not None]
+    broadcasts = [{"role": row.role, "message": row.message, "created_at": row.created_at}
+                  for row in rows if row.user_id is None]
+    if personal:
+        for row in db.execute(insert(Notification).returning(
+                Notification.id, Notification.user_id, Notification.message, Notification.created_at,
+                sort_by_parameter_order=True), personal):
+            track(db, row._asdict())
+    if broadcasts:
+        for row in db.execute(insert(BroadcastNotification).returning(
+                BroadcastNotification.id, BroadcastNotification.role, BroadcastNotification.message,
+                BroadcastNotification.created_at, sort_by_parameter_order=True), broadcasts):
+            track(db, row._asdict())
+    db.commit()
+    return len(rows)
+
+
+class OutboxDispatcher:
+    """Drains the outbox from every worker.
+
+    Commits that enqueue wake this worker's dispatcher at once; commits elsewhere are
+    found by polling. Wake-ups arriving while a drain runs coalesce into one more pass,
+    so bursts are written in full batches.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.dispatched = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run(), name="notification_outbox")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def wake(self):
+        # Callable from any thread
+        if self.task is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await asyncio.to_thread(self.drain)
+            except Exception as e:
+                logging.exception("Notification outbox dispatch failed")
+                self.failures += 1
+                self.last_error = repr(e)
+
+    def drain(self) -> int:
+        moved = 0
+        with Session(database.engine) as db:
+            while True:
+                count = dispatch(db)
+                if count:
+                    self.batches += 1
+                    self.dispatched += count
+                    moved += count
+                if count < OUTBOX_BATCH_SIZE:
+                    return moved
+
+    def stats(self) -> dict:
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "dispatched": self.dispatched,
+            "batches": self.batches,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+dispatcher = OutboxDispatcher()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    if session.info.pop(ENQUEUED_KEY, False):
+        dispatcher.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(ENQUEUED_KEY, None)
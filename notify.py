@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import Iterable, Tuple
+
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from models import NotificationOutbox
+from notification_outbox import enqueued
+
+# Notifications are recorded in the outbox in the caller's transaction, so they exist
+# exactly when the change they describe commits; notification_outbox writes them out.
+
+
+def notify_user(db: Session, user_id: int, message: str):
+    db.add(NotificationOutbox(user_id=user_id, message=message))
+    enqueued(db)
+
+
+def notify_users(db: Session, notices: Iterable[Tuple[int, str]]):
+    # One multi-row INSERT for a batch of (user_id, message) pairs
+    rows = [{"user_id": user_id, "message": message, "created_at": datetime.utcnow()}
+            for user_id, message in notices]
+    if rows:
+        db.execute(insert(NotificationOutbox), rows)
+        enqueued(db)
+
+
+def notify_role(db: Session, role: str, message: str):
+    # One stored message for every user holding `role`; reads are tracked per user
+    # in BroadcastReceipt instead of fanning out one Notification row per user.
+    db.add(NotificationOutbox(role=role, message=message))
+    enqueued(db)
@@ -0,0 +1,63 @@
+import base64
+import binascii
+import json
+from datetime import date
+from typing import Callable, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence) -> str:
+    # Opaque to clients: the sort key of the last row on the page
+    payload = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def invalid_cursor() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+
+def decode_cursor(cursor: str, *types: Callable) -> tuple:
+    """Decode a cursor made by encode_cursor, converting each value with `types`."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return tuple(None if v is None else convert(v) for convert, v in zip(types, values))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise invalid_cursor()
+
+
+def keyset_after(keys: Sequence[Tuple[object, bool]], values: Sequence):
+    """WHERE clause selecting the rows that sort after `values`.
+
+    `keys` are the ORDER BY expressions as (expression, descending) pairs. When all
+    of them sort the same way a row-value comparison is used, which PostgreSQL can
+    answer from a matching composite index.
+    """
+    directions = {descending for _, descending in keys}
+    columns = [expression for expression, _ in keys]
+    if len(directions) == 1:
+        return tuple_(*columns) < tuple(values) if directions.pop() else tuple_(*columns) > tuple(values)
+
+    clauses = []
+    for i, (expression, descending) in enumerate(keys):
+        ties = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*ties, expression < values[i] if descending else expression > values[i]))
+    return or_(*clauses)
+
+
+def page(rows: list, limit: int, cursor_for: Callable) -> Tuple[list, Optional[str]]:
+    """Trim a `limit + 1` fetch to `limit` rows and return the cursor for the next page, if any."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(cursor_for(rows[-1]))
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,92 @@
+"""Check that the hot queries are answered from an index.
+
+Each query is EXPLAINed with sequential scans discouraged, so a Seq Scan in the
+plan means no usable index exists rather than that the table is small. With
+seqscan off the planner may instead walk a whole unrelated index, so index
+scans without an index condition count as full scans too. Only PostgreSQL
+plans are checked.
+
+    DATABASE_URL=postgresql+psycopg2://... python query_plans.py
+"""
+import sys
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import desc, exists, false, func, text
+from sqlmodel import select
+
+import database
+from models import BookAuthorAssociation, BroadcastNotification, BroadcastReceipt, Loan, Notification, User
+
+HOT_QUERIES = {
+    "notifications_newest_first": select(Notification)
+        .where(Notification.user_id == 1)
+        .order_by(desc(Notification.created_at), desc(Notification.id)).limit(10),
+    "unread_notification_count": select(func.count()).select_from(Notification)
+        .where(Notification.user_id == 1, Notification.is_read == false()),
+    "unread_broadcast_count": select(func.count()).select_from(BroadcastNotification)
+        .where(BroadcastNotification.role == "Member", BroadcastNotification.id > 1000,
+               ~exists().where(BroadcastReceipt.broadcast_id == BroadcastNotification.id,
+                               BroadcastReceipt.user_id == 1)),
+    "notifications_to_archive": select(Notification.created_at, Notification.id)
+        .where(Notification.created_at < datetime(2000, 1, 1))
+        .order_by(Notification.created_at, Notification.id).limit(1000),
+    "loan_history_newest_first": select(Loan)
+        .where(Loan.borrower_id == 1)
+        .order_by(desc(Loan.issue_date), desc(Loan.id)).limit(10),
+    "open_loans_by_borrower": select(Loan.id)
+        .where(Loan.borrower_id == 1, Loan.returned == false()),
+    "next_due_open_loan_by_book": select(Loan.due_date)
+        .where(Loan.borrowed_book_id == 1, Loan.returned == false())
+        .order_by(Loan.due_date).limit(1),
+    "users_by_role": select(User.id).where(User.role == "Librarian"),
+    "books_by_author": select(BookAuthorAssociation.book_id).where(BookAuthorAssociation.author_id == 1),
+}
+
+
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+
+def full_scans(plan: dict) -> List[str]:
+    node = plan.get("Node Type")
+    if node == "Seq Scan":
+        found = [plan["Relation Name"]]
+    elif node in INDEX_SCANS and "Index Cond" not in plan:
+        found = [plan["Index Name"]]
+    else:
+        found = []
+    for child in plan.get("Plans", []):
+        found += full_scans(child)
+    return found
+
+
+def check_plans(connection) -> Dict[str, List[str]]:
+    """Return the hot queries that fall back to a full scan, with the tables or indexes scanned."""
+    regressions = {}
+    with connection.begin():
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, query in HOT_QUERIES.items():
+            sql = query.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+            plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()[0]["Plan"]
+            tables = full_scans(plan)
+            if tables:
+                regressions[name] = tables
+        connection.rollback()
+    return regressions
+
+
+def main() -> int:
+    if database.engine.dialect.name != "postgresql":
+        print("Query plans are only checked on PostgreSQL.")
+        return 0
+    with database.engine.connect() as connection:
+        regressions = check_plans(connection)
+    for name, tables in regressions.items():
+        print(f"{name}: full scan of {', '.join(tables)}")
+    if not regressions:
+        print(f"All {len(HOT_QUERIES)} hot queries use an index.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,52 +1,62 @@
-from fastapi import APIRouter,Query
+from fastapi import APIRouter,Query,Response
 from fastapi import  Depends, HTTPException,status
-import database,models
-from sqlmodel import Session,select,desc
+import catalog_cache,database,models,pagination
+from sqlmodel import select,desc
+from sqlalchemy.orm import selectinload
+from sqlmodel.ext.asyncio.session import AsyncSession
 import OAuth2
-from typing import List
+from typing import List, Optional
 router = APIRouter(
     tags=['Author'],
     prefix='/Author'
 )
 
 @router.get('/search_by_pen_name', response_model=List[models.AuthorDetails])
-def search_by_pen_name(
+async def search_by_pen_name(
     pen_name: str,
-    db: Session = Depends(database.get_db),
-    skip: int = Query(0, ge=0, description="Number of authors to skip"),
-    limit: int = Query(10, le=100, description="Maximum number of authors to return")
+    response: Response,
+    db: AsyncSession = Depends(database.get_db),
+    skip: int = Query(0, ge=0, description="Number of authors to skip (ignored when cursor is given)"),
+    limit: int = Query(10, le=100, description="Maximum number of authors to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page")
 ):
-    # Fetch authors matching the provided pen name with pagination
-    statement = (select(models.Author)
-                 .where(models.Author.pen_name.ilike(f"%{pen_name}%"))
-                 .offset(skip)
-                 .limit(limit))
-    authors = db.exec(statement).all()
+    after_id = pagination.decode_cursor(cursor, int)[0] if cursor else None
+
+    async def load():
+        # Fetch authors matching the provided pen name, one keyset page at a time
+        # Book titles come from one selectin query for the whole page, not one per author
+        statement = (select(models.Author)
+                     .where(models.Author.pen_name.ilike(f"%{pen_name}%"))
+                     .options(selectinload(models.Author.books).load_only(models.Book.title))
+                     .order_by(models.Author.id))
+        if after_id is not None:
+            statement = statement.where(models.Author.id > after_id)
+        else:
+            statement = statement.offset(skip)
+        authors, next_cursor = pagination.page((await db.exec(statement.limit(limit + 1))).all(), limit, lambda author: (author.id,))
+        details = [
+            models.AuthorDetails(
+                pen_name=author.pen_name,
+                email=author.email,
+                books=[book.title for book in author.books]
+            ).model_dump(mode="json")
+            for author in authors
+        ]
+        return {"authors": details, "next_cursor": next_cursor}
+
+    params = {"pen_name": pen_name, "skip": None if cursor else skip, "limit": limit, "cursor": cursor}
+    page = await catalog_cache.catalog_cache.get_or_load("search_by_pen_name", params, load)
+    pagination.set_next_cursor(response, page["next_cursor"])
     
-    if not authors:
+    if not page["authors"]:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No authors found with the given pen name")
     
-    # Prepare the list of author details
-    author_details_list = []
-    for author in authors:
-        # Fetch the books associated with the author
-        books = db.exec(select(models.Book)
-                        .join(models.BookAuthorAssociation)
-                        .where(models.BookAuthorAssociation.author_id == author.id)).all()
-        book_titles = [book.title for book in books]
-        
-        author_details_list.append(models.AuthorDetails(
-            pen_name=author.pen_name,
-            email=author.email,
-            books=book_titles
-        ))
-    
-    return author_details_list
+    return page["authors"]
 
 @router.post('/create_author')
-def create_author(
+async def create_author(
     request : models.AuthorCreate,
-    db : Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_uow),
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
     ):
    # This api is not returning anything 
@@ -56,47 +66,48 @@ def create_author(
     else:
         author_books = [title for title in request.author_books if title.strip()]
 
-    check_email = db.exec(select(models.User).where(models.User.email == request.email)).first()
+    check_email = (await db.exec(select(models.User).where(models.User.email == request.email))).first()
     if check_email:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,detail=f"Email {request.email} already exists.")
 
+    # Check the books before writing anything
+    book_ids = {}
+    if author_books:
+        books = (await db.exec(select(models.Book).where(models.Book.title.in_(request.author_books)))).fetchall()
+        found_titles = {book.title for book in books}
+        requested_titles = set(request.author_books)
+
+        if not requested_titles.issubset(found_titles):
+            missing_titles = requested_titles - found_titles
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail=f"Book titles {','.join(missing_titles)} not found")
+
+        for book in sorted(books, key=lambda book: book.id):
+            book_ids.setdefault(book.title, book.id)
+
     author_data = models.Author(
         pen_name=request.pen_name,
         email=request.email
     )
 
     db.add(author_data)
-    db.commit()
-    db.refresh(author_data)
+    await db.flush()
 
-    if author_books:
-        books = db.exec(select(models.Book).where(models.Book.title.in_(request.author_books))).fetchall()
-        found_titles = {book.title for book in books}
-        requested_titles = set(request.author_books)
+    #Associate author with book
+    for title in dict.fromkeys(author_books):
+        db.add(models.BookAuthorAssociation(book_id=book_ids[title], author_id=author_data.id))
 
-        if not requested_titles.issubset(found_titles):
-            missing_titles = requested_titles - found_titles
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail=f"Book titles {','.join(missing_titles)} not found")
-        
-        
-        #Associate author with book
-        for title in request.author_books:
-            book = db.exec(select(models.Book).where(models.Book.title==title)).first()
-            association = models.BookAuthorAssociation(book_id=book.id,author_id=author_data.id)
-            db.add(association)
-        
-        db.commit()
+    catalog_cache.mark_changed(db)
 
     return author_data
 
 @router.put('/update_author/{author_id}')
-def update_author(
+async def update_author(
     author_id: int, request: models.AuthorUpdate,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_uow),
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
     ):
 
-    author = db.exec(select(models.Author).where(models.Author.id == author_id)).first()
+    author = (await db.exec(select(models.Author).where(models.Author.id == author_id))).first()
     if not author:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Author with ID {author_id} not found")
 
@@ -106,27 +117,27 @@ def update_author(
     if request.email:
         author.email = request.email
 
-    db.commit()
+    catalog_cache.mark_changed(db)
 
     return author
 
 @router.delete('/delete_author/{author_id}')
-def delete_author(
+async def delete_author(
     author_id: int,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_uow),
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
     ):
     
-    author = db.exec(select(models.Author).where(models.Author.id == author_id)).first()
+    author = (await db.exec(select(models.Author).where(models.Author.id == author_id))).first()
     if not author:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Author with ID {author_id} not found")
 
     # Delete associations first to avoid foreign key constraint issues
-    associations = db.exec(select(models.BookAuthorAssociation).where(models.BookAuthorAssociation.author_id == author_id)).all()
+    associations = (await db.exec(select(models.BookAuthorAssociation).where(models.BookAuthorAssociation.author_id == author_id))).all()
     for association in associations:
-        db.delete(association)
+        await db.delete(association)
     # Delete author
-    db.delete(author)
-    db.commit()
+    await db.delete(author)
+    catalog_cache.mark_changed(db)
 
     return {"detail": "Author deleted successfully"}
\ No newline at end of file
@@ -1,58 +1,73 @@
 from datetime import date
-from fastapi import APIRouter,Query
+from fastapi import APIRouter,File,Query,Response,UploadFile
 from fastapi import  Depends, HTTPException,status
-import database,models
-from sqlmodel import Session,select,and_
+from starlette.concurrency import run_in_threadpool
+import catalog_cache,catalog_import,database,models,pagination,search
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 import OAuth2
-from typing import Optional
+from typing import List, Optional
 
 
 router = APIRouter(
     tags = ['Book'],
     prefix='/book'
 )
-@router.get("/search_books")
-def search_books(
+@router.get("/search_books", response_model=List[models.BookSearchResult])
+async def search_books(
+    response: Response,
     title: Optional[str] = Query(None, description="Filter books by title"),
     author: Optional[str] = Query(None, description="Filter books by author"),
     genre: Optional[str] = Query(None, description="Filter books by genre"),
-    db: Session = Depends(database.get_db),
-    skip: int = Query(0, ge=0, description="Number of books to skip"),
-    limit: int = Query(10, le=100, description="Maximum number of books to return")
+    q: Optional[str] = Query(None, description="Full-text search over title and genre, ranked by relevance"),
+    db: AsyncSession = Depends(database.get_db),
+    skip: int = Query(0, ge=0, description="Number of books to skip (ignored when cursor is given)"),
+    limit: int = Query(10, le=100, description="Maximum number of books to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page")
 ):
-    query = select(models.Book)
-    
-    if title:
-        query = query.where(models.Book.title.ilike(f"%{title}%"))
-    
-    if genre:
-        query = query.where(models.Book.genre.ilike(f"%{genre}%"))
-    
-    query = query.offset(skip).limit(limit)
-    
-    books = db.exec(query).all()
-
-    if author:
-        author_books_query = (
-            select(models.Book)
-            .join(models.BookAuthorAssociation)
-            .join(models.Author)
-            .where(and_(models.Author.pen_name.ilike(f"%{author}%"),
-                        models.Book.id.in_([book.id for book in books])))
-            .offset(skip)
-            .limit(limit)
-        )
-        books = db.exec(author_books_query).all()
+    after = pagination.decode_cursor(cursor, float, int) if cursor else None
+
+    async def load():
+        query = search.search_books_query(search.is_postgres(db), title=title, genre=genre, q=q, author=author, after=after)
+        
+        if after is None:
+            query = query.offset(skip)
+        query = query.limit(limit + 1)
+        
+        rows, next_cursor = pagination.page((await db.exec(query)).all(), limit, lambda row: (row.rank, row.Book.id))
+        books = [
+            models.BookSearchResult(**book.model_dump(), authors=search.split_authors(authors)).model_dump(mode="json")
+            for book, authors, _ in rows
+        ]
+        return {"books": books, "next_cursor": next_cursor}
+
+    params = {"title": title, "author": author, "genre": genre, "q": q, "skip": None if cursor else skip, "limit": limit, "cursor": cursor}
+    page = await catalog_cache.catalog_cache.get_or_load("search_books", params, load)
+    pagination.set_next_cursor(response, page["next_cursor"])
     
-    return books
+    return page["books"]
 
 @router.post('/create_book')
-def create_book(
+async def create_book(
     request: models.BookCreate,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_uow),
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
     ):
     
+    # Check the authors before writing anything
+    author_ids = {}
+    if request.author_pen_names:
+        authors = (await db.exec(select(models.Author).where(models.Author.pen_name.in_(request.author_pen_names)))).fetchall()
+        found_pen_names = {author.pen_name for author in authors}
+        requested_pen_names = set(request.author_pen_names)
+
+        if not requested_pen_names.issubset(found_pen_names):
+            missing_pen_names = requested_pen_names - found_pen_names
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Author pen names {', '.join(missing_pen_names)} not found")
+
+        for author in sorted(authors, key=lambda author: author.id):
+            author_ids.setdefault(author.pen_name, author.id)
+
     book_data = models.Book(
         title=request.title,
         genre=request.genre,
@@ -63,49 +78,65 @@ def create_book(
     )
 
     db.add(book_data)
-    db.commit()
-    db.refresh(book_data)
+    await db.flush()
 
-    # Associate the book with authors
-    if request.author_pen_names:
-        authors = db.exec(select(models.Author).where(models.Author.pen_name.in_(request.author_pen_names))).fetchall()
-        found_pen_names = {author.pen_name for author in authors}
-        requested_pen_names = set(request.author_pen_names)
+    # Associate book with found authors
+    for pen_name in dict.fromkeys(request.author_pen_names or []):
+        db.add(models.BookAuthorAssociation(book_id=book_data.id, author_id=author_ids[pen_name]))
 
-        if not requested_pen_names.issubset(found_pen_names):
-            missing_pen_names = requested_pen_names - found_pen_names
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Author pen names {', '.join(missing_pen_names)} not found")
+    catalog_cache.mark_changed(db)
 
-        # Associate book with found authors
-        for pen_name in request.author_pen_names:
-            author = db.exec(select(models.Author).where(models.Author.pen_name == pen_name)).first()
-            association = models.BookAuthorAssociation(book_id=book_data.id, author_id=author.id)
-            db.add(association)
+    return book_data
 
-        db.commit()
+@router.post('/import')
+async def import_books(
+    file: UploadFile = File(..., description="CSV with a header row, or NDJSON with one book per line"),
+    format: Optional[str] = Query(None, description="csv or ndjson; taken from the file extension when omitted"),
+    db: AsyncSession = Depends(database.get_db),
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    fmt = catalog_import.format_for(file.filename, format)
+    if fmt is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload a .csv or .ndjson file, or pass format=csv|ndjson.")
 
-    return book_data
+    # Parsing runs in the threadpool and each batch is written and committed on its own,
+    # so a bad row or batch is reported without losing the rest of the feed.
+    report = catalog_import.ImportReport()
+    rows = catalog_import.read_rows(file.file, fmt)
+    while True:
+        batch = await run_in_threadpool(catalog_import.next_batch, rows, catalog_import.IMPORT_BATCH_SIZE, report)
+        if not batch:
+            break
+        await db.run_sync(catalog_import.write_batch, batch, report)
+
+    return {
+        "detail": f"Imported {report.imported} books, {report.failed} rows failed.",
+        "imported": report.imported,
+        "failed": report.failed,
+        "batches": report.batches,
+        "errors": report.errors,
+    }
 
 @router.delete('/delete_book/{id}')
-def delete_book(
+async def delete_book(
     id: int,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_uow),
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
 ):
 
-    book = db.exec(select(models.Book).where(models.Book.id == id)).first()
+    book = (await db.exec(select(models.Book).where(models.Book.id == id))).first()
     if not book:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Book with id {id} not found."
         )
     
-    check_loans = db.exec(
+    check_loans = (await db.exec(
         select(models.Loan).where(
             models.Loan.borrowed_book_id == id,
             models.Loan.returned == False
         )
-    ).all()
+    )).all()
     
     if check_loans:
         raise HTTPException(
@@ -114,27 +145,27 @@ def delete_book(
         )
     
     # Remove associations related to the book
-    associations = db.exec(select(models.BookAuthorAssociation).where(models.BookAuthorAssociation.book_id == id)).all()
+    associations = (await db.exec(select(models.BookAuthorAssociation).where(models.BookAuthorAssociation.book_id == id))).all()
     for association in associations:
-        db.delete(association)
+        await db.delete(association)
     
     # Delete the book
-    db.delete(book)
-    db.commit()
+    await db.delete(book)
+    catalog_cache.mark_changed(db)
     
     return {"message": "Book and its associations deleted successfully."}
 
 @router.put('/update_book/{id}')
-def update_book(
+async def update_book(
     id:int,
     title:str=None,
     pages:int=None,
     total_copies:int=None,
-    db:Session=Depends(database.get_db),
+    db: AsyncSession =Depends(database.get_uow),
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
     ):
     
-    book = db.exec(select(models.Book).where(models.Book.id==id)).first()
+    book = (await db.exec(select(models.Book).where(models.Book.id==id))).first()
 
     if title:
         book.title = title
@@ -143,5 +174,5 @@ def update_book(
     if total_copies:
         book.total_copies = total_copies
     
-    db.commit()
+    catalog_cache.mark_changed(db)
     return {"Book details have been updated."}
\ No newline at end of file
@@ -0,0 +1,75 @@
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+import export, models, search
+import OAuth2
+
+router = APIRouter(
+    tags=['Export'],
+    prefix='/export'
+)
+
+BOOK_COLUMNS = ["id", "title", "genre", "pages", "total_copies", "copies_available", "copies_on_rent", "next_available_on", "author_pen_names"]
+LOAN_COLUMNS = ["id", "borrower_id", "borrowed_book_id", "issue_date", "due_date", "returned", "overdue", "loan_amount", "fine",
+                "loan_requested", "loan_approved", "return_requested", "return_accepted", "cancel_requested", "cancel_accepted"]
+NOTIFICATION_COLUMNS = ["id", "user_id", "message", "is_read", "created_at"]
+
+
+def streaming_export(name: str, statement, columns, fmt: str, transform=None) -> StreamingResponse:
+    if fmt not in export.FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"format must be one of {', '.join(export.FORMATS)}.")
+    return StreamingResponse(
+        export.encode(export.stream_partitions(statement), columns, fmt, transform),
+        media_type=export.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    )
+
+
+@router.get('/books')
+async def export_books(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    # CSV output uses the same columns as /book/import, so an export can be loaded again
+    statement = select(*[getattr(models.Book, column) for column in BOOK_COLUMNS[:-1]],
+                       search.book_authors_column()).order_by(models.Book.id)
+    return streaming_export("books", statement, BOOK_COLUMNS, format,
+                            lambda row: (*row[:-1], search.split_authors(row[-1])))
+
+
+@router.get('/loans')
+async def export_loans(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    issued_from: Optional[date] = Query(None, description="Only loans issued on or after this date"),
+    issued_to: Optional[date] = Query(None, description="Only loans issued on or before this date"),
+    returned: Optional[bool] = Query(None, description="Filter by returned status"),
+    overdue: Optional[bool] = Query(None, description="Filter by overdue status"),
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    statement = select(*[getattr(models.Loan, column) for column in LOAN_COLUMNS]).order_by(models.Loan.id)
+    if issued_from:
+        statement = statement.where(models.Loan.issue_date >= issued_from)
+    if issued_to:
+        statement = statement.where(models.Loan.issue_date <= issued_to)
+    if returned is not None:
+        statement = statement.where(models.Loan.returned == returned)
+    if overdue is not None:
+        statement = statement.where(models.Loan.overdue == overdue)
+    return streaming_export("loans", statement, LOAN_COLUMNS, format)
+
+
+@router.get('/notifications')
+async def export_notifications(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    created_from: Optional[date] = Query(None, description="Only notifications created on or after this date"),
+    created_to: Optional[date] = Query(None, description="Only notifications created on or before this date"),
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    statement = select(*[getattr(models.Notification, column) for column in NOTIFICATION_COLUMNS]).order_by(models.Notification.id)
+    if created_from:
+        statement = statement.where(models.Notification.created_at >= datetime.combine(created_from, time.min))
+    if created_to:
+        statement = statement.where(models.Notification.created_at < datetime.combine(created_to + timedelta(days=1), time.min))
+    return streaming_export("notifications", statement, NOTIFICATION_COLUMNS, format)
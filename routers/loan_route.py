@@ -1,7 +1,11 @@
+import logging
 from datetime import date
+from typing import List
 from fastapi import Depends, HTTPException,status,APIRouter
-import database,models
-from sqlmodel import Session,select
+import catalog_cache,database,inventory,models,loan_batch,loan_sweep,notify
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 import OAuth2
 
 
@@ -12,46 +16,45 @@ router = APIRouter(
 
 
 @router.post('/librarian/check_overdue_loans')
-def check_overdue_loans(
-    db: Session = Depends(database.get_db), 
+async def check_overdue_loans(
+    db: AsyncSession = Depends(database.get_db), 
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
     ):
 
-    open_loans = db.exec(select(models.Loan).where(models.Loan.returned == False)).all()
+    stats = await db.run_sync(loan_sweep.sweep_overdue_loans)
 
-    if not open_loans:
+    if not stats.chunks:
         return {"detail": "No open loans found"}
 
-    for loan in open_loans:
-        loan.check_overdue()
-
-    db.commit()
-
-    return {"detail": "Overdue status updated for all open loans"}
+    return {
+        "detail": "Overdue status updated for all open loans",
+        "rows_touched": stats.rows_touched,
+        "marked_overdue": stats.marked_overdue,
+        "cleared": stats.cleared,
+        "elapsed_ms": stats.elapsed_ms
+    }
 
 
 @router.post('/User/create_loan')
-def create_loan(
+async def create_loan(
     rent_title: str,
-    db: Session = Depends(database.get_db),
-    token_data: models.TokenData = Depends(OAuth2.role_required(["Member"]))
+    db: AsyncSession = Depends(database.get_uow),
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member"]))
     ):
     
-    user = db.exec(select(models.User).where(models.User.email == token_data.email)).first()
-    
-    check_book = db.exec(select(models.Book).where(models.Book.title == rent_title)).first()
+    check_book = (await db.exec(select(models.Book).where(models.Book.title == rent_title))).first()
 
     if not check_book:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Book '{rent_title}' not found.")
     
     if check_book.copies_available > 0:
 
-        user_id = user.id
+        user_id = principal.id
         book_id = check_book.id
         
-        check_loan = db.exec(select(models.Loan).where(models.Loan.borrower_id == user_id,
+        check_loan = (await db.exec(select(models.Loan).where(models.Loan.borrower_id == user_id,
                                                         models.Loan.borrowed_book_id == book_id
-                                                        , models.Loan.returned == False)).first()
+                                                        , models.Loan.returned == False))).first()
         if check_loan:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You have already loaned this book.")
 
@@ -59,63 +62,31 @@ def create_loan(
             borrower_id=user_id,
             borrowed_book_id=book_id
         )
-
-        db.add(loan_data)
-        db.commit()
-        db.refresh(loan_data)
-
         loan_data.loan_requested = True
 
-        notification = models.Notification(
-            user_id=user_id,
-            message=f"Loan Requested: Loan ID {loan_data.id} for Book '{rent_title}'. Waiting for librarian to approve.",
-            is_read=False
-        )
-
-        db.add(notification)
-        
-        librarians = db.exec(select(models.User).where(models.User.role == 'Librarian')).all()
-
-        for librarian in librarians:
-            notification = models.Notification(
-            user_id=librarian.id,
-            message=f"Approval request for loan ID {loan_data.id} has been made by User ID : {user.id}. Please review.",
-            is_read=False
-        )
-            
-        db.add(notification)
+        db.add(loan_data)
+        await db.flush()
 
-        db.commit()
+        notify.notify_user(db, user_id, f"Loan Requested: Loan ID {loan_data.id} for Book '{rent_title}'. Waiting for librarian to approve.")
+        notify.notify_role(db, 'Librarian', f"Approval request for loan ID {loan_data.id} has been made by User ID : {principal.id}. Please review.")
 
         return {"message": f"Loan request created with ID: {loan_data.id}"}
     
     if check_book.copies_available == 0:
 
-        book_id = check_book.id
-
-        statement = (select(models.Loan)
-              .where(models.Loan.borrowed_book_id == book_id, models.Loan.returned == False)
-              .order_by(models.Loan.due_date))
-        
-        next_available_loan = db.exec(statement).first()
-
-        if next_available_loan:
-            next_available_date = next_available_loan.due_date
-            check_book.next_available_on = next_available_date
-
-            return {"message": f"No copies available. Next available date: {next_available_date}"}
+        # Kept current by every checkout and check-in, so no lookup over the open loans here
+        if check_book.next_available_on:
+            return {"message": f"No copies available. Next available date: {check_book.next_available_on}"}
         return {"message": "Currently there are no copies of this book available with the library."}
 
 @router.post('/User/cancel_loan')
-def cancel_loan(
+async def cancel_loan(
     loan_id: int, 
-    db: Session = Depends(database.get_db), 
-    token_data: models.TokenData = Depends(OAuth2.role_required(["Member"]))
+    db: AsyncSession = Depends(database.get_uow), 
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member"]))
     ):
-    
-    user = db.exec(select(models.User).where(models.User.email == token_data.email)).first()
 
-    loan = db.exec(select(models.Loan).where(models.Loan.id == loan_id)).first()
+    loan = (await db.exec(select(models.Loan).where(models.Loan.id == loan_id))).first()
 
     if not loan:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Loan not found.")
@@ -126,36 +97,20 @@ def cancel_loan(
     if loan.returned:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail= f"You have already returned the book.")
 
-    notification = models.Notification(
-            user_id=user.id,
-            message=f"Loan cancellation requested for Loan ID {loan_id}.",
-            is_read=False
-        )
-    
-    db.add(notification)
-
-    librarians = db.exec(select(models.User).where(models.User.role == 'Librarian')).all()
-
-    for librarian in librarians:
-        notification = models.Notification(
-            user_id=librarian.id,
-            message=f"Cancellation request for loan ID {loan_id} has been made by User ID : {user.id}. Please review.",
-            is_read=False
-        )
-        db.add(notification)
+    notify.notify_user(db, principal.id, f"Loan cancellation requested for Loan ID {loan_id}.")
+    notify.notify_role(db, 'Librarian', f"Cancellation request for loan ID {loan_id} has been made by User ID : {principal.id}. Please review.")
     loan.cancel_requested=True
-    db.commit()
 
     return {"message": "Cancellation request sent to librarians."}
 
 @router.post('/User/return_book')
-def return_book(
+async def return_book(
     loan_id: int,
-    db: Session = Depends(database.get_db),
-    token_data: models.TokenData = Depends(OAuth2.role_required(["Member"]))
+    db: AsyncSession = Depends(database.get_uow),
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member"]))
     ):
     
-    loan = db.exec(select(models.Loan).where(models.Loan.id == loan_id)).first()
+    loan = (await db.exec(select(models.Loan).where(models.Loan.id == loan_id))).first()
 
     if not loan:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Loan not found.")
@@ -163,31 +118,14 @@ def return_book(
     if loan.returned:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Book has already been returned.")
     
-    user = db.exec(select(models.User).where(models.User.email == token_data.email)).first()
-    
-    if loan.borrower_id != user.id:
+    if loan.borrower_id != principal.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to return this book.")
 
-    book = db.exec(select(models.Book).where(models.Book.id == loan.borrowed_book_id)).first()
+    book = (await db.exec(select(models.Book).where(models.Book.id == loan.borrowed_book_id))).first()
     if book:
         loan.return_requested = True
-        notification = models.Notification(
-            user_id=user.id,
-            message=f"Book return requested for Loan ID {loan_id}.",
-            is_read=False
-        )
-        db.add(notification)
-
-        librarians = db.exec(select(models.User).where(models.User.role == 'Librarian')).all()
-
-        for librarian in librarians:
-            notification = models.Notification(
-            user_id=librarian.id,
-            message=f"Return request for loan ID {loan_id} has been made by User ID : {user.id}. Please review.",
-            is_read=False
-        )
-        db.add(notification)
-        db.commit()
+        notify.notify_user(db, principal.id, f"Book return requested for Loan ID {loan_id}.")
+        notify.notify_role(db, 'Librarian', f"Return request for loan ID {loan_id} has been made by User ID : {principal.id}. Please review.")
 
         return {"message": "Book return requested."}
 
@@ -195,54 +133,69 @@ def return_book(
 
 
 @router.post('/librarian/approve_loan')
-def approve_loan(
+async def approve_loan(
     request: models.LoanApprovalRequest, 
-    db: Session = Depends(database.get_db), 
+    db: AsyncSession = Depends(database.get_uow), 
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))):
 
-    loan = db.exec(select(models.Loan).where(models.Loan.id == request.loan_id)).first()
+    loan = (await db.exec(select(models.Loan).where(models.Loan.id == request.loan_id))).first()
     if not loan:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Loan not found.")
 
     if loan.loan_approved:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Loan is already approved.")
-    
-    check_book = db.exec(select(models.Book).where(models.Book.id == loan.borrowed_book_id)).first()
 
-    check_book.copies_available -= 1
-    check_book.copies_on_rent += 1
-    loan.loan_approved = True
+    if loan.returned:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Loan has already been canceled or returned.")
 
     if request.due_date:
         if request.due_date < loan.issue_date:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Due date cannot be before the issue date. Setting due date to 15 days ahead by default. Approve the loan id once again.")
         if request.due_date < date.today():
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Due date cannot be in the past. Setting due date to 15 days ahead by default. Approve the loan id once again.")
-        
-        loan.due_date = request.due_date
 
-    db.add(loan)
-    db.commit()
-    loan = db.exec(select(models.Loan).where(models.Loan.id == request.loan_id)).first()
-    
-    notification = models.Notification(
-        user_id=loan.borrower_id,
-        message=f"Your loan request for book ID {loan.borrowed_book_id} has been approved. Please make sure you return the book by {loan.due_date} to avoid fine.",
-        is_read=False
-    )
-    db.add(notification)
-    db.commit()
+    # Claim the loan, then a copy, each with a conditional UPDATE: of two concurrent
+    # approvals only one can pass each guard, and the loser's raise rolls it back.
+    approved = (await db.exec(
+        update(models.Loan)
+        .where(models.Loan.id == loan.id, models.Loan.loan_approved == False, models.Loan.returned == False)
+        .values(loan_approved=True, due_date=request.due_date or models.Loan.due_date)
+        .returning(models.Loan.due_date)
+    )).first()
+    if not approved:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Loan is already approved.")
+
+    book_id = loan.borrowed_book_id
+    if not (await db.exec(inventory.checkout(book_id))).first():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"No copies of book ID {book_id} are available.")
+    # Search results carry the counts and next_available_on just changed
+    catalog_cache.mark_changed(db)
+
+    notify.notify_user(db, loan.borrower_id, f"Your loan request for book ID {book_id} has been approved. Please make sure you return the book by {approved.due_date} to avoid fine.")
 
     return {"message": "Loan approved successfully."}
 
+@router.post('/librarian/approve_loans', response_model=List[models.LoanBatchResult])
+async def approve_loans(
+    request: models.LoanBatchApprovalRequest,
+    db: AsyncSession = Depends(database.get_uow),
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))):
+
+    if not request.loans:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No loans given.")
+    if len(request.loans) > loan_batch.LOAN_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {loan_batch.LOAN_BATCH_MAX} loans can be approved at once.")
+
+    return await db.run_sync(loan_batch.approve_loans, request.loans)
+
 @router.post('/librarian/cancel_loan')
-def cancel_loan(
+async def cancel_loan(
     request: models.LoanCancellationRequest,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_uow),
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))):
     
 
-    loan = db.exec(select(models.Loan).where(models.Loan.id == request.loan_id)).first()
+    loan = (await db.exec(select(models.Loan).where(models.Loan.id == request.loan_id))).first()
 
     if not loan:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Loan not found.")
@@ -250,51 +203,69 @@ def cancel_loan(
     if loan.cancel_accepted:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Loan is already canceled.")
     
+    # Canceling an approved loan puts its copy back on the shelf
+    on_rent = (await db.exec(
+        update(models.Loan)
+        .where(models.Loan.id == loan.id, models.Loan.loan_approved == True, models.Loan.returned == False)
+        .values(returned=True)
+        .returning(models.Loan.id)
+    )).first()
+    if on_rent:
+        await db.exec(inventory.checkin(loan.borrowed_book_id))
+        catalog_cache.mark_changed(db)
+
     loan.cancel_accepted = True
     loan.returned = True
-    
-    db.commit()
 
-    notification = models.Notification(
-        user_id=loan.borrower_id,
-        message=f"Your loan request for book ID {loan.borrowed_book_id} has been canceled.",
-        is_read=False
-    )
-    db.add(notification)
-    db.commit()
+    notify.notify_user(db, loan.borrower_id, f"Your loan request for book ID {loan.borrowed_book_id} has been canceled.")
 
     return {"message": "Loan canceled successfully."}
 
 @router.post('/librarian/return_book')
-def return_book(
+async def return_book(
     request: models.LoanReturnRequest,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_uow),
     token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
     ):
 
-    loan = db.exec(select(models.Loan).where(models.Loan.id == request.loan_id)).first()
+    loan = (await db.exec(select(models.Loan).where(models.Loan.id == request.loan_id))).first()
     if not loan:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Loan not found.")
 
     if not loan.loan_approved or loan.returned:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Loan is not approved or has already been returned.")
 
-    loan.returned = True
-    loan.return_accepted = True
-    book = db.exec(select(models.Book).where(models.Book.id == loan.borrowed_book_id)).first()
-    if book:
-        book.copies_available += 1
-        book.copies_on_rent -= 1
-        db.add(book)
-    # db.add(loan)
-    db.commit()
-
-    notification = models.Notification(
-        user_id=loan.borrower_id,
-        message=f"Book ID {loan.borrowed_book_id} has been returned successfully.",
-        is_read=False
-    )
-    db.add(notification)
-    db.commit()
-
-    return {"message": "Book returned successfully."}
\ No newline at end of file
+    returned = (await db.exec(
+        update(models.Loan)
+        .where(models.Loan.id == loan.id, models.Loan.loan_approved == True, models.Loan.returned == False)
+        .values(returned=True, return_accepted=True, **loan_batch.settled_fine(db.bind.dialect.name, date.today()))
+        .returning(models.Loan.id)
+    )).first()
+    if not returned:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Loan is not approved or has already been returned.")
+
+    if not (await db.exec(inventory.checkin(loan.borrowed_book_id))).first():
+        # The return still stands; a missing book or zero on-rent count is a data problem to look into
+        logging.warning("Returned loan %s but book %s had no copies on rent", loan.id, loan.borrowed_book_id)
+    catalog_cache.mark_changed(db)
+
+    notify.notify_user(db, loan.borrower_id, f"Book ID {loan.borrowed_book_id} has been returned successfully.")
+
+    return {"message": "Book returned successfully."}
+
+@router.post('/librarian/return_books', response_model=List[models.LoanBatchResult])
+async def return_books(
+    request: models.LoanBatchReturnRequest,
+    db: AsyncSession = Depends(database.get_uow),
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+    ):
+
+    if request.book_ids and request.borrower_id is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="borrower_id is required when returning by book ID.")
+    count = len(request.loan_ids) + len(request.book_ids)
+    if not count:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No loans given.")
+    if count > loan_batch.LOAN_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {loan_batch.LOAN_BATCH_MAX} loans can be returned at once.")
+
+    return await db.run_sync(loan_batch.return_loans, request.loan_ids, request.borrower_id, request.book_ids)
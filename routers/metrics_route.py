@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends
+import catalog_cache, database, models, hashing, notification_hub, notification_outbox
+from starlette.concurrency import run_in_threadpool
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import OAuth2
+from scheduler import scheduler
+
+router = APIRouter(
+    tags=['Metrics'],
+    prefix='/metrics'
+)
+
+@router.get('/jobs')
+async def get_job_metrics(
+    db: AsyncSession = Depends(database.get_db),
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    # Per-worker counters plus the cluster-wide last run recorded on each job lease.
+    leases = {lease.name: lease for lease in (await db.exec(select(models.JobLease))).all()}
+    return [
+        {**job.stats(), "lease": leases.get(name)}
+        for name, job in scheduler.jobs.items()
+    ]
+
+@router.get('/token_cache')
+async def get_token_cache_metrics(
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    return OAuth2.token_cache.stats()
+
+@router.get('/hashing')
+async def get_hashing_metrics(
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    return hashing.hash_pool.stats()
+
+@router.get('/db_pool')
+async def get_db_pool_metrics(
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    return database.pool_stats()
+
+@router.get('/catalog_cache')
+async def get_catalog_cache_metrics(
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    return await run_in_threadpool(catalog_cache.catalog_cache.stats)
+
+@router.get('/notification_push')
+async def get_notification_push_metrics(
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    return notification_hub.hub.stats()
+
+@router.get('/notification_outbox')
+async def get_notification_outbox_metrics(
+    db: AsyncSession = Depends(database.get_db),
+    token_data: models.TokenData = Depends(OAuth2.role_required(["Librarian"]))
+):
+    # Per-worker dispatch counters, plus what is still waiting in the outbox cluster-wide
+    pending = (await db.exec(select(func.count()).select_from(models.NotificationOutbox))).one()
+    return {**notification_outbox.dispatcher.stats(), "pending": pending}
@@ -1,6 +1,14 @@
-from fastapi import Depends, HTTPException, status, APIRouter, Query
-import database, models
-from sqlmodel import Session, select, desc
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional
+from fastapi import Depends, HTTPException, status, APIRouter, Query, Response, WebSocket
+from fastapi.responses import StreamingResponse
+import database, models, notification_hub, pagination
+from sqlmodel import select, desc
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import and_, exists, false, func, insert, literal, or_, true, union_all, update
 import OAuth2
 # from sqlalchemy import desc
 
@@ -8,41 +16,231 @@ router = APIRouter(
     tags=['Notification']
 )
 
-@router.get('/notifications')
-def get_notifications(
-    db: Session = Depends(database.get_db),
-    token_data: models.TokenData = Depends(OAuth2.role_required(["Member","Librarian"])),
-    skip: int = Query(0, ge=0, description="Number of notifications to skip"),
-    limit: int = Query(10, le=100, description="Maximum number of notifications to return")
+@router.get('/notifications', response_model=List[models.NotificationDetails])
+async def get_notifications(
+    response: Response,
+    db: AsyncSession = Depends(database.get_db),
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member","Librarian"])),
+    skip: int = Query(0, ge=0, description="Number of notifications to skip (ignored when cursor is given)"),
+    limit: int = Query(10, le=100, description="Maximum number of notifications to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page")
 ):
-    user = db.exec(select(models.User).where(models.User.email == token_data.email)).first()
-    
-    
-    statement = (select(models.Notification)
-                 .where(models.Notification.user_id == user.id)
-                 .order_by(desc(models.Notification.created_at))  # Order by created_at in descending order
-                 .offset(skip)
-                 .limit(limit))
-    notifications = db.exec(statement).all()
-    
-    return notifications
+    personal = (select(models.Notification.id,
+                       models.Notification.message,
+                       models.Notification.is_read,
+                       models.Notification.created_at,
+                       false().label("broadcast"))
+                .where(models.Notification.user_id == principal.id))
+
+    # Broadcasts to the user's role since they joined, read once this user has a receipt
+    # for them or they are at or below the user's read watermark
+    broadcast = (select(models.BroadcastNotification.id,
+                        models.BroadcastNotification.message,
+                        or_(models.BroadcastReceipt.user_id.is_not(None),
+                            models.BroadcastNotification.id <= read_watermark(principal)).label("is_read"),
+                        models.BroadcastNotification.created_at,
+                        true().label("broadcast"))
+                 .outerjoin(models.BroadcastReceipt,
+                            and_(models.BroadcastReceipt.broadcast_id == models.BroadcastNotification.id,
+                                 models.BroadcastReceipt.user_id == principal.id))
+                 .where(models.BroadcastNotification.role == principal.role,
+                        models.BroadcastNotification.created_at >= joined_at(principal)))
+
+    merged = union_all(personal, broadcast).subquery()
+    # Newest first; broadcast breaks ties between personal and broadcast rows sharing an id
+    statement = (select(*merged.c)
+                 .order_by(desc(merged.c.created_at), desc(merged.c.id), desc(merged.c.broadcast)))
+    if cursor:
+        after = pagination.decode_cursor(cursor, datetime.fromisoformat, int, bool)
+        statement = statement.where(pagination.keyset_after(
+            [(merged.c.created_at, True), (merged.c.id, True), (merged.c.broadcast, True)], after))
+    else:
+        statement = statement.offset(skip)
+    notifications, next_cursor = pagination.page((await db.exec(statement.limit(limit + 1))).all(), limit,
+                                                 lambda row: (row.created_at, row.id, row.broadcast))
+    pagination.set_next_cursor(response, next_cursor)
+
+    return [
+        models.NotificationDetails(
+            id=row.id,
+            user_id=principal.id,
+            message=row.message,
+            is_read=row.is_read,
+            created_at=row.created_at,
+            broadcast=row.broadcast
+        )
+        for row in notifications
+    ]
+
+@router.get('/notifications/stream')
+async def stream_notifications(
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member","Librarian"]))
+):
+    # Server-sent events: one "notification" event per new row, "resync" when the
+    # client should re-read GET /notifications, and a comment line as keep-alive.
+    user_id, role = principal.id, principal.role
+
+    async def events():
+        async with notification_hub.hub.subscribe(user_id, role) as subscription:
+            yield "retry: 5000\n\n"
+            while True:
+                event = await subscription.next()
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.websocket('/notifications/ws')
+async def notifications_socket(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None, description="Bearer token, for clients that cannot set headers on the handshake")
+):
+    authorization = websocket.headers.get("authorization", "")
+    token = token or (authorization[7:] if authorization.lower().startswith("bearer ") else None)
+    try:
+        if not token:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+        # A session for the handshake only: idle sockets must not pin a pooled connection
+        async with asynccontextmanager(database.get_db)() as db:
+            principal = await OAuth2.principal_from_token(token, ["Member","Librarian"], db)
+    except HTTPException as e:
+        # Accept first so the client sees the close code and reason, not a bare 403 handshake
+        await websocket.accept()
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+
+    await websocket.accept()
+    async with notification_hub.hub.subscribe(principal.id, principal.role) as subscription:
+        async def push():
+            while True:
+                event = await subscription.next()
+                await websocket.send_json(event or {"type": "ping"})
+
+        async def drain():
+            # Clients have nothing to send; reading is how a disconnect is noticed
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+
+        tasks = [asyncio.create_task(push()), asyncio.create_task(drain())]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def joined_at(principal: OAuth2.Principal):
+    # Broadcasts older than the account were never addressed to this user
+    return select(models.User.created_at).where(models.User.id == principal.id).scalar_subquery()
+
+def read_watermark(principal: OAuth2.Principal):
+    return select(models.User.last_read_broadcast_id).where(models.User.id == principal.id).scalar_subquery()
+
+def unread_broadcasts(principal: OAuth2.Principal):
+    # Broadcasts to the user's role above their read watermark and since they joined,
+    # without a receipt from this user: an index range on (role, id), not every broadcast
+    receipt = (select(models.BroadcastReceipt.broadcast_id)
+               .where(models.BroadcastReceipt.broadcast_id == models.BroadcastNotification.id,
+                      models.BroadcastReceipt.user_id == principal.id))
+    return and_(models.BroadcastNotification.role == principal.role,
+                models.BroadcastNotification.id > read_watermark(principal),
+                models.BroadcastNotification.created_at >= joined_at(principal),
+                ~exists(receipt))
+
+@router.get('/notifications/unread_count')
+async def get_unread_count(
+    db: AsyncSession = Depends(database.get_db),
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member","Librarian"]))
+):
+    # Counts only: the personal side is answered from the partial index on unread rows
+    personal = (await db.exec(select(func.count()).select_from(models.Notification)
+                              .where(models.Notification.user_id == principal.id, models.Notification.is_read == False))).one()
+    broadcast = (await db.exec(select(func.count()).select_from(models.BroadcastNotification)
+                               .where(unread_broadcasts(principal)))).one()
+
+    return {"unread": personal + broadcast, "personal": personal, "broadcast": broadcast}
+
+@router.put('/notifications/read')
+async def mark_notifications_as_read(
+    up_to: Optional[datetime] = Query(None, description="Mark notifications created at or before this time (default: now)"),
+    up_to_id: Optional[int] = Query(None, description="Only personal notifications with an id at or below this one"),
+    broadcast_up_to_id: Optional[int] = Query(None, description="Only broadcast notifications with an id at or below this one"),
+    db: AsyncSession = Depends(database.get_uow),
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member","Librarian"]))
+):
+    now = datetime.utcnow()
+    up_to = up_to or now
+    # An id bound names one kind of notification; without any, both kinds are marked
+    marked = receipts = 0
+
+    if up_to_id is not None or broadcast_up_to_id is None:
+        personal = (update(models.Notification)
+                    .where(models.Notification.user_id == principal.id,
+                           models.Notification.is_read == False,
+                           models.Notification.created_at <= up_to)
+                    .values(is_read=True)
+                    .execution_options(synchronize_session=False))
+        if up_to_id is not None:
+            personal = personal.where(models.Notification.id <= up_to_id)
+        marked = (await db.exec(personal)).rowcount
+
+    if broadcast_up_to_id is not None or up_to_id is None:
+        # Receipts for every matching unread broadcast, written by one INSERT ... SELECT
+        unread = (select(models.BroadcastNotification.id, literal(principal.id), literal(now))
+                  .where(unread_broadcasts(principal), models.BroadcastNotification.created_at <= up_to))
+        if broadcast_up_to_id is not None:
+            unread = unread.where(models.BroadcastNotification.id <= broadcast_up_to_id)
+        receipts = (await db.exec(insert(models.BroadcastReceipt)
+                                  .from_select(["broadcast_id", "user_id", "read_at"], unread))).rowcount
+
+        # Move the watermark up to just below the oldest broadcast still unread, or to the
+        # newest broadcast when none is, so later counts skip everything read so far
+        oldest_unread = select(func.min(models.BroadcastNotification.id)).where(unread_broadcasts(principal)).scalar_subquery()
+        newest = (select(func.max(models.BroadcastNotification.id))
+                  .where(models.BroadcastNotification.role == principal.role).scalar_subquery())
+        await db.exec(update(models.User)
+                      .where(models.User.id == principal.id)
+                      .values(last_read_broadcast_id=func.coalesce(oldest_unread - 1, newest, models.User.last_read_broadcast_id))
+                      .execution_options(synchronize_session=False))
+
+    return {"message": "Notifications marked as read.", "marked": marked, "broadcasts_marked": receipts}
 
 @router.put('/notifications/{notification_id}/read')
-def mark_notification_as_read(
+async def mark_notification_as_read(
     notification_id: int,
-    db: Session = Depends(database.get_db),
-    token_data: models.TokenData = Depends(OAuth2.role_required(["Member","Librarian"]))
+    broadcast: bool = Query(False, description="Whether the id refers to a broadcast notification"),
+    db: AsyncSession = Depends(database.get_uow),
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member","Librarian"]))
 ):
-    notification = db.exec(select(models.Notification).where(models.Notification.id == notification_id)).first()
-    
+
+    if broadcast:
+        notification = (await db.exec(select(models.BroadcastNotification).where(models.BroadcastNotification.id == notification_id))).first()
+
+        if not notification:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notification not found.")
+
+        if notification.role != principal.role:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to update this notification.")
+
+        user = await principal.load_user()
+        if user is None or notification.created_at < user.created_at:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notification not found.")
+
+        if not await db.get(models.BroadcastReceipt, (notification_id, principal.id)):
+            db.add(models.BroadcastReceipt(broadcast_id=notification_id, user_id=principal.id))
+
+        return {"message": "Notification marked as read."}
+
+    notification = (await db.exec(select(models.Notification).where(models.Notification.id == notification_id))).first()
+
     if not notification:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notification not found.")
-    
-    if notification.user_id != db.exec(select(models.User).where(models.User.email == token_data.email)).first().id:
+
+    if notification.user_id != principal.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to update this notification.")
-    
+
     notification.is_read = True
     db.add(notification)
-    db.commit()
-    
+
     return {"message": "Notification marked as read."}
@@ -1,9 +1,11 @@
-from datetime import timedelta
+from datetime import date, timedelta
 from fastapi import APIRouter,Query
 from fastapi import  Depends, HTTPException,status
 from fastapi.security import OAuth2PasswordRequestForm
-import database,models,hashing,JWTtoken
-from sqlmodel import Session,select,desc
+import database,models,hashing,JWTtoken,pagination
+from sqlmodel import select,desc,func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional
 
 import OAuth2
 
@@ -16,22 +18,23 @@ router = APIRouter(
 # Find a way to block this api from authorised users
 
 @router.post("/create_user")
-def create_user(first_name : str,last_name : str,email :str,password : str,role:str = 'Member', db : Session = Depends(database.get_db) ):
+async def create_user(first_name : str,last_name : str,email :str,password : str,role:str = 'Member', db : AsyncSession = Depends(database.get_uow) ):
 
-    check_email = db.exec(select(models.User).where(models.User.email == email)).first()
+    check_email = (await db.exec(select(models.User).where(models.User.email == email))).first()
     if check_email:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,detail=f"Email {email} already exists.")
+    # Broadcasts sent before the account existed are never unread for it
+    last_broadcast_id = (await db.exec(select(func.max(models.BroadcastNotification.id)))).one() or 0
     if role == 'Member':
         data = models.User(
         first_name=first_name,
         last_name=last_name,
         email=email,
-        password=hashing.Hash.bcrypt(password),
-        role=role)
+        password=await hashing.Hash.bcrypt_async(password),
+        role=role,
+        last_read_broadcast_id=last_broadcast_id)
 
         db.add(data)
-        db.commit()
-        db.refresh(data)
 
         return {"Message" : "User created successfully with Member role" }
     
@@ -42,11 +45,10 @@ def create_user(first_name : str,last_name : str,email :str,password : str,role:
     first_name=first_name,
     last_name=last_name,
     email=email,
-    password=hashing.Hash.bcrypt(password),
-    role='Librarian')
+    password=await hashing.Hash.bcrypt_async(password),
+    role='Librarian',
+    last_read_broadcast_id=last_broadcast_id)
         db.add(data)
-        db.commit()
-    db.refresh(data)
 
     return {"Message" : "User created successfully with Librarian role" }
 
@@ -56,13 +58,14 @@ def create_user(first_name : str,last_name : str,email :str,password : str,role:
 # Get user info 
 # -> Returns User Fullname , email and list of all loans
 @router.get('/details')
-def get_user_details(
-    db: Session = Depends(database.get_db),
-    token_data: models.TokenData = Depends(OAuth2.role_required(["Member"])),
-    skip: int = Query(0, ge=0, description="Number of loans to skip"),
-    limit: int = Query(10, le=100, description="Maximum number of loans to return")
+async def get_user_details(
+    db: AsyncSession = Depends(database.get_db),
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member"])),
+    skip: int = Query(0, ge=0, description="Number of loans to skip (ignored when cursor is given)"),
+    limit: int = Query(10, le=100, description="Maximum number of loans to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor value from the previous page")
 ):
-    user_details = db.exec(select(models.User).where(models.User.email == token_data.email)).first()
+    user_details = await principal.load_user()
     
     if not user_details:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exist")
@@ -71,11 +74,16 @@ def get_user_details(
         select(models.Loan, models.Book)
         .join(models.Book, models.Loan.borrowed_book_id == models.Book.id)
         .where(models.Loan.borrower_id == user_details.id)
-        .order_by(desc(models.Loan.issue_date))  # Optionally, order by issue_date in descending order
-        .offset(skip)
-        .limit(limit)
+        .order_by(desc(models.Loan.issue_date), desc(models.Loan.id))  # Newest loans first
     )
-    loan_details = db.exec(loan_details_query).all()
+    if cursor:
+        after = pagination.decode_cursor(cursor, date.fromisoformat, int)
+        loan_details_query = loan_details_query.where(
+            pagination.keyset_after([(models.Loan.issue_date, True), (models.Loan.id, True)], after))
+    else:
+        loan_details_query = loan_details_query.offset(skip)
+    loan_details, next_cursor = pagination.page((await db.exec(loan_details_query.limit(limit + 1))).all(), limit,
+                                                lambda row: (row.Loan.issue_date, row.Loan.id))
 
     loans = [
         models.LoanDetails(
@@ -95,53 +103,52 @@ def get_user_details(
         first_name=user_details.first_name,
         last_name=user_details.last_name,
         email=user_details.email,
-        loans=loans
+        loans=loans,
+        next_cursor=next_cursor
     )
 
     return user_response
 @router.put('/update_user')
-def update_user_details(
+async def update_user_details(
     password: str,
     first_name : str = None,
     last_name : str = None,
     new_password : str = None,
-    db : Session=Depends(database.get_db),
-    token_data: models.TokenData = Depends(OAuth2.role_required(["Member"]))):
+    db : AsyncSession=Depends(database.get_uow),
+    principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member"]))):
     
-    user = db.exec(select(models.User).where(models.User.email == token_data.email)).first()
+    user = await principal.load_user()
     # if not user:
     #     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail=f"user does not exit")
     
-    if not hashing.Hash.verify(user.password, password):
+    if not await hashing.Hash.verify_async(user.password, password):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Incorrect Password.")
     if first_name:
         user.first_name = first_name
     if last_name:
         user.last_name = last_name
     if new_password:
-        user.password = hashing.Hash.bcrypt(new_password)
+        user.password = await hashing.Hash.bcrypt_async(new_password)
     
-    db.commit()
     return {"User details updated."}
 
 @router.delete('/delete_user')
-def delete_user(password: str,
-                db: Session = Depends(database.get_db),
-                token_data: models.TokenData = Depends(OAuth2.role_required(["Member"]))):
+async def delete_user(password: str,
+                db: AsyncSession = Depends(database.get_uow),
+                principal: OAuth2.Principal = Depends(OAuth2.principal_required(["Member"]))):
     
-    user = db.exec(select(models.User).where(models.User.email == token_data.email)).first()
+    user = await principal.load_user()
     # if not user:
     #     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail=f"user does not exit")
-    if not hashing.Hash.verify(user.password, password):
+    if not await hashing.Hash.verify_async(user.password, password):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Incorrect Password.")
     
     # Find all loans for the user that have not been returned
-    ongoing_loans = db.exec(select(models.Loan).where(models.Loan.borrower_id == user.id)).all()
+    ongoing_loans = (await db.exec(select(models.Loan).where(models.Loan.borrower_id == user.id))).all()
     for ongoing_loan in ongoing_loans:
         if not ongoing_loan.returned:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail=f"Clear your loans first.")
     
     # Proceed with deletion if no ongoing loans
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
     return {"message": "User deleted successfully."}
\ No newline at end of file
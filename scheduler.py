@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+import database
+import jobs
+from models import JobLease
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "0.1"))
+# A running job extends its lease at least this often, so a slow run is never taken over
+SCHEDULER_LEASE_RENEW_SECONDS = float(os.getenv("SCHEDULER_LEASE_RENEW_SECONDS", "60"))
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[Session], int]
+    interval: float
+    jitter: float = 0.0
+    runs: int = 0
+    skipped: int = 0
+    failures: int = 0
+    last_run_at: Optional[datetime] = None
+    last_duration_ms: Optional[float] = None
+    last_rows: Optional[int] = None
+    last_error: Optional[str] = None
+    next_run_at: Optional[datetime] = None
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_run_at": self.last_run_at,
+            "last_duration_ms": self.last_duration_ms,
+            "last_rows": self.last_rows,
+            "last_error": self.last_error,
+            "next_run_at": self.next_run_at,
+        }
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add_job(self, name: str, func: Callable[[Session], int], interval: float, jitter: Optional[float] = None):
+        if jitter is None:
+            jitter = interval * SCHEDULER_JITTER
+        self.jobs[name] = Job(name=name, func=func, interval=interval, jitter=jitter)
+
+    def start(self):
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"job:{job.name}"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _loop(self, job: Job):
+        # Spread the first run too, so workers started together don't all race for the lease.
+        delay = random.uniform(0, job.jitter)
+        while True:
+            job.next_run_at = datetime.utcnow() + timedelta(seconds=delay)
+            await asyncio.sleep(delay)
+            await asyncio.to_thread(self.run_job, job.name)
+            delay = max(0.0, job.interval + random.uniform(-job.jitter, job.jitter))
+
+    def run_job(self, name: str) -> bool:
+        """Run a job now if this worker can take its lease; returns whether it ran."""
+        job = self.jobs[name]
+        # The lease is shorter than the interval by the jitter, so the worker's own
+        # next tick is never early enough to be refused.
+        lease = job.interval - job.jitter
+        claimed_at = acquire_lease(job.name, lease)
+        if claimed_at is None:
+            job.skipped += 1
+            return False
+
+        started = time.perf_counter()
+        job.last_run_at = datetime.utcnow()
+        rows, error = None, None
+        try:
+            with renewing_lease(job.name, claimed_at, lease), Session(database.engine) as db:
+                rows = job.func(db)
+            job.runs += 1
+        except Exception as e:
+            logger.exception("Scheduled job %s failed", job.name)
+            job.failures += 1
+            error = repr(e)
+        job.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        job.last_rows = rows
+        job.last_error = error
+        record_run(job)
+        return True
+
+
+def acquire_lease(name: str, duration: float) -> Optional[datetime]:
+    # A lease row per job is claimed with a conditional UPDATE, so only one worker
+    # across all uvicorn processes runs a given job per interval. The claim time,
+    # stored as last_started_at, identifies the holder when the lease is renewed.
+    now = datetime.utcnow()
+    leased_until = now + timedelta(seconds=duration)
+    with Session(database.engine) as db:
+        claimed = db.execute(
+            update(JobLease)
+            .where(JobLease.name == name, JobLease.leased_until <= now)
+            .values(leased_until=leased_until, last_started_at=now)
+        ).rowcount
+        if not claimed and db.get(JobLease, name) is None:
+            db.add(JobLease(name=name, leased_until=leased_until, last_started_at=now))
+            claimed = 1
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker created the lease row first.
+            db.rollback()
+            return None
+    return now if claimed else None
+
+
+def renew_lease(name: str, claimed_at: datetime, duration: float) -> bool:
+    # Extends the lease to `duration` from now, but only while this run still holds it
+    now = datetime.utcnow()
+    leased_until = now + timedelta(seconds=duration)
+    with Session(database.engine) as db:
+        held = db.execute(
+            update(JobLease)
+            .where(JobLease.name == name, JobLease.last_started_at == claimed_at)
+            .values(leased_until=leased_until)
+        ).rowcount
+        db.commit()
+    return bool(held)
+
+
+@contextmanager
+def renewing_lease(name: str, claimed_at: datetime, duration: float):
+    """Keep the lease alive from a heartbeat thread while the block runs.
+
+    Renewing well inside the lease's length means a run that outlasts its interval
+    still holds the lease, and other workers keep skipping the job until it ends.
+    """
+    period = min(SCHEDULER_LEASE_RENEW_SECONDS, duration / 3)
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(period):
+            try:
+                if not renew_lease(name, claimed_at, duration):
+                    logger.warning("Scheduled job %s lost its lease while running", name)
+                    return
+            except Exception:
+                logger.exception("Renewing the lease of scheduled job %s failed", name)
+
+    thread = threading.Thread(target=heartbeat, name=f"lease:{name}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def record_run(job: Job):
+    with Session(database.engine) as db:
+        db.execute(
+            update(JobLease)
+            .where(JobLease.name == job.name)
+            .values(last_duration_ms=job.last_duration_ms, last_rows=job.last_rows, last_error=job.last_error)
+        )
+        db.commit()
+
+
+scheduler = Scheduler()
+scheduler.add_job("overdue_sweep", jobs.overdue_sweep,
+                  interval=float(os.getenv("OVERDUE_SWEEP_INTERVAL_SECONDS", "3600")))
+scheduler.add_job("due_reminders", jobs.due_reminders,
+                  interval=float(os.getenv("DUE_REMINDER_INTERVAL_SECONDS", "21600")))
+scheduler.add_job("notification_archive", jobs.notification_archive,
+                  interval=float(os.getenv("NOTIFICATION_ARCHIVE_INTERVAL_SECONDS", "86400")))
@@ -0,0 +1,97 @@
+from functools import reduce
+from operator import add
+from typing import List, Optional
+
+from sqlalchemy import desc, exists, func, null, or_, text
+from sqlmodel import select
+
+import pagination
+from models import Author, Book, BookAuthorAssociation, book_search_document
+
+SEARCH_CONFIG = text("'simple'::regconfig")
+# Unit separator: cannot appear in a pen name typed into a form
+AUTHOR_SEPARATOR = "\x1f"
+
+
+def is_postgres(db) -> bool:
+    return db.bind.dialect.name == "postgresql"
+
+
+def book_authors_column():
+    # Correlated aggregate, evaluated only for the rows that survive offset/limit
+    return (
+        select(func.aggregate_strings(Author.pen_name, AUTHOR_SEPARATOR))
+        .join(BookAuthorAssociation, BookAuthorAssociation.author_id == Author.id)
+        .where(BookAuthorAssociation.book_id == Book.id)
+        .scalar_subquery()
+        .label("authors")
+    )
+
+
+def split_authors(authors: Optional[str]) -> List[str]:
+    return sorted(authors.split(AUTHOR_SEPARATOR)) if authors else []
+
+
+def search_books_query(
+    postgres: bool,
+    title: Optional[str] = None,
+    genre: Optional[str] = None,
+    q: Optional[str] = None,
+    author: Optional[str] = None,
+    after: Optional[tuple] = None
+):
+    """Catalog search, ranked by relevance on PostgreSQL.
+
+    On PostgreSQL the ILIKE filters are served by the pg_trgm GIN indexes and
+    `q` is a full-text query over title and genre that also accepts close
+    (trigram-similar) title matches. Elsewhere, e.g. SQLite in development, the
+    same filters fall back to plain ILIKE scans ordered by id.
+
+    Rows are `(Book, authors, rank)` where `authors` is the book's pen names
+    joined by AUTHOR_SEPARATOR and `rank` is None when results are ordered by id
+    alone. The author filter is a semi-join, so a book with several matching
+    authors still appears once and pagination stays exact. `after` is the
+    `(rank, id)` of the last row of the previous page.
+    """
+    query = select(Book, book_authors_column())
+    rank = []
+
+    if title:
+        query = query.where(Book.title.ilike(f"%{title}%"))
+        if postgres:
+            rank.append(func.similarity(Book.title, title))
+
+    if genre:
+        query = query.where(Book.genre.ilike(f"%{genre}%"))
+        if postgres:
+            rank.append(func.similarity(Book.genre, genre))
+
+    if q:
+        if postgres:
+            document = book_search_document()
+            tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+            query = query.where(or_(document.bool_op("@@")(tsquery), Book.title.bool_op("%")(q)))
+            rank += [func.ts_rank(document, tsquery), func.similarity(Book.title, q)]
+        else:
+            query = query.where(or_(Book.title.ilike(f"%{q}%"), Book.genre.ilike(f"%{q}%")))
+
+    if author:
+        query = query.where(exists(
+            select(BookAuthorAssociation.book_id)
+            .join(Author, Author.id == BookAuthorAssociation.author_id)
+            .where(BookAuthorAssociation.book_id == Book.id, Author.pen_name.ilike(f"%{author}%"))
+        ))
+
+    if rank:
+        relevance = reduce(add, rank)
+        query = query.add_columns(relevance.label("rank"))
+        if after:
+            if after[0] is None:
+                raise pagination.invalid_cursor()
+            query = query.where(pagination.keyset_after([(relevance, True), (Book.id, False)], after))
+        return query.order_by(desc(relevance), Book.id)
+
+    query = query.add_columns(null().label("rank"))
+    if after:
+        query = query.where(Book.id > after[1])
+    return query.order_by(Book.id)
@@ -1,5 +1,6 @@
 import pytest
-from httpx import AsyncClient
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.exc import OperationalError
 
 BASE_URL = "http://localhost:8000"
 
@@ -90,6 +91,33 @@ async def test_search_by_pen_name():
     assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
     
 
+@pytest.mark.asyncio
+async def test_search_by_pen_name_query_count():
+    # Runs the app in-process against the same database so statements can be counted
+    import database, main
+    from sqlalchemy import event
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+    engines = [database.engine] + ([database.async_engine.sync_engine] if database.async_engine else [])
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count)
+    try:
+        counts = []
+        async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://test") as client:
+            for limit in (1, 100):
+                statements.clear()
+                response = await client.get('/Author/search_by_pen_name', params={'pen_name': "e", 'limit': limit})
+                assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+                counts.append(len(statements))
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", count)
+        if database.async_engine is not None:
+            await database.async_engine.dispose()
+    assert counts[0] == counts[1], f"Query count grew with page size: {counts}"
+    
+
 @pytest.mark.asyncio
 async def test_search_books():
     async with AsyncClient(base_url=BASE_URL) as client:
@@ -104,6 +132,40 @@ async def test_search_books():
     assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
     
 
+@pytest.mark.asyncio
+async def test_search_books_by_author():
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.get(
+            '/book/search_books',
+            params={'author': "G", 'limit': 100}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    ids = [book["id"] for book in response.json()]
+    assert len(ids) == len(set(ids)), "Books with several matching authors were returned more than once."
+    for book in response.json():
+        assert any("g" in pen_name.lower() for pen_name in book["authors"])
+
+@pytest.mark.asyncio
+async def test_search_books_full_text():
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.get(
+            '/book/search_books',
+            params={'q': "python"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    assert isinstance(response.json(), list)
+    
+
+@pytest.mark.asyncio
+async def test_search_books_next_available_on():
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.get('/book/search_books', params={'title': "Python"})
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    for book in response.json():
+        assert "next_available_on" in book, "No 'next_available_on' in search result."
+        if book["copies_on_rent"] == 0:
+            assert book["next_available_on"] is None
+
 @pytest.mark.asyncio
 async def test_create_loan(access_token):
     async with AsyncClient(base_url=BASE_URL) as client:
@@ -126,3 +188,585 @@ async def test_approve_loan(librarian_access_token):
         )
     assert response.status_code == 404, f"Expected 200 but got {response.status_code}. Response: {response.text}"
 
+@pytest.mark.asyncio
+async def test_approve_loans_batch(librarian_access_token):
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.post(
+            '/loan/librarian/approve_loans',
+            json={'loans': [{'loan_id': 999999}, {'loan_id': 999998}, {'loan_id': 999998}]},
+            headers={"Authorization": f"Bearer {await librarian_access_token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    results = {result["loan_id"]: result for result in response.json()}
+    assert results[999999]["status_code"] == 404
+    assert results[999998]["status_code"] == 400 and not results[999998]["ok"]
+
+@pytest.mark.asyncio
+async def test_return_books_batch(librarian_access_token):
+    token = await librarian_access_token
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.post(
+            '/loan/librarian/return_books',
+            json={'loan_ids': [999999], 'borrower_id': 999999, 'book_ids': [999999]},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        missing_borrower = await client.post(
+            '/loan/librarian/return_books',
+            json={'book_ids': [1]},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    assert [result["status_code"] for result in response.json()] == [404, 404]
+    assert missing_borrower.status_code == 400
+
+@pytest.mark.asyncio
+async def test_check_overdue_loans(librarian_access_token):
+    # Seeds an approved loan five days late: the sweep must fine it once, and a second sweep must leave it alone
+    from datetime import date, timedelta
+    from sqlmodel import Session, select
+    import database, models
+    try:
+        with Session(database.engine) as session:
+            user_id = session.exec(select(models.User.id)).first()
+            book = models.Book(title="Overdue Sweep Probe", total_copies=1, copies_available=0, copies_on_rent=1)
+            session.add(book)
+            session.flush()
+            loan = models.Loan(borrower_id=user_id, borrowed_book_id=book.id)
+            loan.due_date = date.today() - timedelta(days=5)
+            loan.loan_approved = True
+            session.add(loan)
+            session.commit()
+            book_id, loan_id = book.id, loan.id
+    except OperationalError:
+        pytest.skip("database not reachable")
+
+    token = await librarian_access_token
+    try:
+        async with AsyncClient(base_url=BASE_URL) as client:
+            first = await client.post('/loan/librarian/check_overdue_loans', headers={"Authorization": f"Bearer {token}"})
+            second = await client.post('/loan/librarian/check_overdue_loans', headers={"Authorization": f"Bearer {token}"})
+        assert first.status_code == 200, f"Expected 200 but got {first.status_code}. Response: {first.text}"
+        first_json = first.json()
+        assert first_json["marked_overdue"] >= 1, "The seeded overdue loan was not marked."
+        assert first_json["rows_touched"] == first_json["marked_overdue"] + first_json["cleared"]
+        assert "elapsed_ms" in first_json, "No 'elapsed_ms' in response."
+        assert second.status_code == 200, f"Expected 200 but got {second.status_code}. Response: {second.text}"
+        assert second.json()["marked_overdue"] == 0, "The second sweep rewrote loans that were already settled."
+        with Session(database.engine) as session:
+            loan = session.get(models.Loan, loan_id)
+            assert loan.overdue and loan.fine == 5 * models.FINE_PER_DAY
+    finally:
+        with Session(database.engine) as session:
+            session.delete(session.get(models.Loan, loan_id))
+            session.delete(session.get(models.Book, book_id))
+            session.commit()
+
+@pytest.mark.asyncio
+async def test_get_job_metrics(librarian_access_token):
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.get(
+            '/metrics/jobs',
+            headers={"Authorization": f"Bearer {await librarian_access_token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    job_names = {job["name"] for job in response.json()}
+    assert {"overdue_sweep", "due_reminders", "notification_archive"} <= job_names
+
+@pytest.mark.asyncio
+async def test_get_librarian_notifications(librarian_access_token):
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.get(
+            '/notifications',
+            headers={"Authorization": f"Bearer {await librarian_access_token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    created_at = [notification["created_at"] for notification in response.json()]
+    assert created_at == sorted(created_at, reverse=True), "Notifications are not ordered by created_at."
+
+@pytest.mark.asyncio
+async def test_token_cache_metrics(librarian_access_token):
+    token = await librarian_access_token
+    async with AsyncClient(base_url=BASE_URL) as client:
+        for _ in range(2):
+            await client.get('/notifications', headers={"Authorization": f"Bearer {token}"})
+        response = await client.get(
+            '/metrics/token_cache',
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    assert response.json()["hits"] >= 2, "Repeated requests with the same token were not served from the cache."
+
+@pytest.mark.asyncio
+async def test_hashing_metrics(librarian_access_token):
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.get(
+            '/metrics/hashing',
+            headers={"Authorization": f"Bearer {await librarian_access_token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    response_json = response.json()
+    assert response_json["submitted"] >= 1, "Login did not go through the hash pool."
+    assert response_json["in_flight"] <= response_json["pool_size"] + response_json["queue_size"]
+
+@pytest.mark.asyncio
+async def test_bulk_read_moves_broadcast_watermark(librarian_access_token):
+    # Bulk mark-read lifts the read watermark to just below the oldest broadcast still unread
+    from datetime import datetime
+    from sqlmodel import Session, select
+    import database, models
+    try:
+        with Session(database.engine) as session:
+            first = models.BroadcastNotification(role="Librarian", message="watermark probe", created_at=datetime.utcnow())
+            second = models.BroadcastNotification(role="Librarian", message="watermark probe", created_at=datetime.utcnow())
+            session.add(first)
+            session.flush()
+            session.add(second)
+            session.commit()
+            first_id, second_id = first.id, second.id
+    except OperationalError:
+        pytest.skip("database not reachable")
+
+    def watermark():
+        with Session(database.engine) as session:
+            return session.exec(select(models.User.last_read_broadcast_id).where(models.User.email == "lib@mail.com")).one()
+
+    token = await librarian_access_token
+    try:
+        async with AsyncClient(base_url=BASE_URL) as client:
+            some = await client.put('/notifications/read', params={'broadcast_up_to_id': first_id}, headers={"Authorization": f"Bearer {token}"})
+            assert some.status_code == 200, f"Expected 200 but got {some.status_code}. Response: {some.text}"
+            assert watermark() == second_id - 1
+            listed = (await client.get('/notifications', params={'limit': 100}, headers={"Authorization": f"Bearer {token}"})).json()
+            read = {row["id"]: row["is_read"] for row in listed if row["broadcast"]}
+            assert read[first_id] is True and read[second_id] is False
+
+            await client.put('/notifications/read', headers={"Authorization": f"Bearer {token}"})
+            assert watermark() >= second_id
+            count = (await client.get('/notifications/unread_count', headers={"Authorization": f"Bearer {token}"})).json()
+        assert count["broadcast"] == 0
+    finally:
+        with Session(database.engine) as session:
+            for row in session.exec(select(models.BroadcastReceipt).where(models.BroadcastReceipt.broadcast_id.in_([first_id, second_id]))):
+                session.delete(row)
+            session.flush()
+            for broadcast_id in (first_id, second_id):
+                session.delete(session.get(models.BroadcastNotification, broadcast_id))
+            session.commit()
+
+def test_catalog_cache_shared_bump_leaves_event_loop(monkeypatch):
+    # A commit on the event loop bumps a shared (network) version from the threadpool, never inline
+    import asyncio, threading
+    import catalog_cache
+    bumped_on = []
+
+    class RecordingRedis(catalog_cache.InMemoryRedis):
+        def incr(self, key):
+            bumped_on.append(threading.get_ident())
+            return super().incr(key)
+
+    cache = catalog_cache.CatalogCache(catalog_cache.RedisBackend(RecordingRedis(), 60))
+    monkeypatch.setattr(catalog_cache, "catalog_cache", cache)
+
+    class CommittedSession:
+        info = {"catalog_changed": True}
+
+    async def commit():
+        catalog_cache._bump_after_commit(CommittedSession())
+        for _ in range(100):
+            if bumped_on:
+                break
+            await asyncio.sleep(0.01)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(commit())
+    assert bumped_on and bumped_on[0] != loop_thread
+    assert cache.backend.version() == 1
+
+def test_hash_pool_timeout_is_busy(monkeypatch):
+    # A hash that outlasts HASH_TIMEOUT_SECONDS is answered like a full queue: 503 with Retry-After
+    import asyncio, time
+    from fastapi import HTTPException
+    import hashing
+    monkeypatch.setattr(hashing, "HASH_TIMEOUT_SECONDS", 0.5)
+    pool = hashing.HashPool(1, 1)
+    try:
+        pool.run(time.sleep, 0)
+        for call in (lambda: pool.run(time.sleep, 3), lambda: asyncio.run(pool.run_async(time.sleep, 3))):
+            with pytest.raises(HTTPException) as error:
+                call()
+            assert error.value.status_code == 503 and error.value.headers == {"Retry-After": "1"}
+        assert pool.stats()["timed_out"] == 2
+    finally:
+        pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_db_pool_metrics(librarian_access_token):
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.get(
+            '/metrics/db_pool',
+            headers={"Authorization": f"Bearer {await librarian_access_token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    for pool in response.json().values():
+        assert pool["checked_out"] + pool["idle"] <= pool["size"] + pool["max_overflow"]
+        assert "wait_ms" in pool and "checkout_ms" in pool
+
+
+@pytest.mark.asyncio
+async def test_notifications_cursor_pagination(librarian_access_token):
+    token = await librarian_access_token
+    async with AsyncClient(base_url=BASE_URL) as client:
+        first = await client.get('/notifications', params={'limit': 1}, headers={"Authorization": f"Bearer {token}"})
+        assert first.status_code == 200, f"Expected 200 but got {first.status_code}. Response: {first.text}"
+        next_cursor = first.headers.get("X-Next-Cursor")
+        if next_cursor:
+            second = await client.get('/notifications', params={'limit': 1, 'cursor': next_cursor}, headers={"Authorization": f"Bearer {token}"})
+            assert second.status_code == 200, f"Expected 200 but got {second.status_code}. Response: {second.text}"
+            assert second.json()[0] != first.json()[0], "The cursor returned the same page again."
+        invalid = await client.get('/notifications', params={'cursor': "not-a-cursor"}, headers={"Authorization": f"Bearer {token}"})
+    assert invalid.status_code == 400
+
+@pytest.mark.asyncio
+async def test_mark_notifications_read_bulk(access_token):
+    token = await access_token
+    async with AsyncClient(base_url=BASE_URL) as client:
+        before = await client.get('/notifications/unread_count', headers={"Authorization": f"Bearer {token}"})
+        assert before.status_code == 200, f"Expected 200 but got {before.status_code}. Response: {before.text}"
+        marked = await client.put('/notifications/read', headers={"Authorization": f"Bearer {token}"})
+        assert marked.status_code == 200, f"Expected 200 but got {marked.status_code}. Response: {marked.text}"
+        after = (await client.get('/notifications/unread_count', headers={"Authorization": f"Bearer {token}"})).json()
+    assert marked.json()["marked"] + marked.json()["broadcasts_marked"] == before.json()["unread"]
+    assert after == {"unread": 0, "personal": 0, "broadcast": 0}
+
+@pytest.mark.asyncio
+async def test_broadcasts_start_when_user_joined(librarian_access_token):
+    # A broadcast older than the account is neither listed nor counted; a newer one is both
+    from datetime import datetime, timedelta
+    from sqlmodel import Session, select
+    import database, models
+    try:
+        with Session(database.engine) as session:
+            joined = session.exec(select(models.User.created_at).where(models.User.email == "lib@mail.com")).one()
+            before_joining = models.BroadcastNotification(role="Librarian", message="joined probe",
+                                                          created_at=joined - timedelta(days=1))
+            since_joining = models.BroadcastNotification(role="Librarian", message="joined probe",
+                                                         created_at=datetime.utcnow())
+            session.add_all([before_joining, since_joining])
+            session.commit()
+            old_id, new_id = before_joining.id, since_joining.id
+    except OperationalError:
+        pytest.skip("database not reachable")
+
+    token = await librarian_access_token
+    try:
+        async with AsyncClient(base_url=BASE_URL) as client:
+            listed = await client.get('/notifications', params={'limit': 100}, headers={"Authorization": f"Bearer {token}"})
+            assert listed.status_code == 200, f"Expected 200 but got {listed.status_code}. Response: {listed.text}"
+            broadcast_ids = {row["id"] for row in listed.json() if row["broadcast"]}
+            assert new_id in broadcast_ids
+            assert old_id not in broadcast_ids, "A broadcast from before the user joined was listed."
+
+            before = (await client.get('/notifications/unread_count', headers={"Authorization": f"Bearer {token}"})).json()
+            await client.put(f'/notifications/{new_id}/read', params={'broadcast': True}, headers={"Authorization": f"Bearer {token}"})
+            after = (await client.get('/notifications/unread_count', headers={"Authorization": f"Bearer {token}"})).json()
+            assert after["broadcast"] == before["broadcast"] - 1
+
+            old = await client.put(f'/notifications/{old_id}/read', params={'broadcast': True}, headers={"Authorization": f"Bearer {token}"})
+        assert old.status_code == 404
+    finally:
+        with Session(database.engine) as session:
+            for row in session.exec(select(models.BroadcastReceipt).where(models.BroadcastReceipt.broadcast_id.in_([old_id, new_id]))):
+                session.delete(row)
+            session.flush()
+            for broadcast_id in (old_id, new_id):
+                session.delete(session.get(models.BroadcastNotification, broadcast_id))
+            session.commit()
+
+@pytest.mark.asyncio
+async def test_notifications_websocket(librarian_access_token):
+    import websockets
+    token = await librarian_access_token
+    ws_url = BASE_URL.replace("http", "ws", 1) + "/notifications/ws"
+    with pytest.raises(websockets.ConnectionClosed) as rejected:
+        async with websockets.connect(ws_url) as socket:
+            await socket.recv()
+    assert rejected.value.rcvd.code == 1008
+    async with websockets.connect(f"{ws_url}?token={token}"):
+        async with AsyncClient(base_url=BASE_URL) as client:
+            response = await client.get('/metrics/notification_push', headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    assert response.json()["subscribers"] >= 1
+
+def test_hot_queries_use_indexes():
+    import database, query_plans
+    if database.engine.dialect.name != "postgresql":
+        pytest.skip("query plans are only checked on PostgreSQL")
+    try:
+        connection = database.engine.connect()
+    except OperationalError:
+        pytest.skip("database not reachable")
+    with connection:
+        assert query_plans.check_plans(connection) == {}
+
+@pytest.mark.asyncio
+async def test_import_books(librarian_access_token):
+    feed = (
+        '{"title": "Imported Book", "genre": "Fiction", "pages": 120, "total_copies": 2}\n'
+        'not json\n'
+        '{"title": "Orphan Book", "total_copies": 1, "author_pen_names": ["No Such Author"]}\n'
+    )
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.post(
+            '/book/import',
+            files={"file": ("feed.ndjson", feed, "application/x-ndjson")},
+            headers={"Authorization": f"Bearer {await librarian_access_token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    response_json = response.json()
+    assert response_json["imported"] == 1
+    assert [error["line"] for error in response_json["errors"]] == [2, 3]
+
+@pytest.mark.asyncio
+async def test_export_loans_csv(librarian_access_token):
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.get(
+            '/export/loans',
+            params={'format': "csv", 'returned': False},
+            headers={"Authorization": f"Bearer {await librarian_access_token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    assert response.headers["content-type"].startswith("text/csv")
+    header, *rows = response.text.splitlines()
+    assert header.startswith("id,borrower_id,borrowed_book_id,issue_date,due_date,returned")
+    assert all(row.split(",")[5] == "False" for row in rows)
+
+@pytest.mark.asyncio
+async def test_catalog_cache_metrics(librarian_access_token):
+    token = await librarian_access_token
+    async with AsyncClient(base_url=BASE_URL) as client:
+        before = (await client.get('/metrics/catalog_cache', headers={"Authorization": f"Bearer {token}"})).json()
+        for title in ("Cache Probe", "cache probe"):
+            await client.get('/book/search_books', params={'title': title})
+        response = await client.get('/metrics/catalog_cache', headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    assert response.json()["hits"] > before["hits"], "A repeated search was not served from the catalog cache."
+
+def test_inventory_concurrent_checkout():
+    # Hammers one title from many threads; the conditional UPDATE must hand out each copy exactly once
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlmodel import Session
+    import database, inventory, models
+    copies, workers = 5, 32
+    try:
+        with Session(database.engine) as session:
+            book = models.Book(title="Inventory Stress Probe", total_copies=copies, copies_available=copies, copies_on_rent=0)
+            session.add(book)
+            session.commit()
+            book_id = book.id
+    except OperationalError:
+        pytest.skip("database not reachable")
+
+    def checkout(_):
+        with Session(database.engine) as session:
+            claimed = session.exec(inventory.checkout(book_id)).first()
+            session.commit()
+            return claimed is not None
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            claimed = sum(pool.map(checkout, range(workers * 2)))
+        with Session(database.engine) as session:
+            book = session.get(models.Book, book_id)
+            assert claimed == copies, f"{claimed} checkouts succeeded for {copies} copies."
+            assert book.copies_available == 0 and book.copies_on_rent == copies
+            assert session.exec(inventory.checkin(book_id, copies + 1)).first() is None, "Check-in went past the copies on rent."
+            session.rollback()
+    finally:
+        with Session(database.engine) as session:
+            session.delete(session.get(models.Book, book_id))
+            session.commit()
+
+def test_scheduler_lease_outlives_slow_job():
+    # A run longer than its lease keeps renewing it, so a second worker skips the job until the run ends
+    import threading, time
+    from sqlmodel import Session
+    import database, models, scheduler
+    name = "lease_probe"
+    started = threading.Event()
+
+    def slow(db):
+        started.set()
+        time.sleep(1.5)
+        return 0
+
+    try:
+        with Session(database.engine) as session:
+            session.get(models.JobLease, name)
+    except OperationalError:
+        pytest.skip("database not reachable")
+
+    first, second = scheduler.Scheduler(), scheduler.Scheduler()
+    for worker in (first, second):
+        worker.add_job(name, slow, interval=0.5, jitter=0)
+    try:
+        runner = threading.Thread(target=first.run_job, args=(name,))
+        runner.start()
+        assert started.wait(5), "The job never started."
+        time.sleep(1)
+        assert second.run_job(name) is False, "A second worker ran the job while the first still held it."
+        runner.join()
+        assert first.jobs[name].runs == 1 and second.jobs[name].skipped == 1
+    finally:
+        with Session(database.engine) as session:
+            lease = session.get(models.JobLease, name)
+            if lease is not None:
+                session.delete(lease)
+                session.commit()
+
+def test_notification_archive():
+    # Expired rows move to the archive with their ids; anything inside its retention window stays put
+    from datetime import datetime, timedelta
+    from sqlmodel import Session, select
+    import database, jobs, models
+    now = datetime.utcnow()
+    rows = {
+        "old_read": models.Notification(user_id=0, message="archive probe", is_read=True,
+                                        created_at=now - timedelta(days=jobs.NOTIFICATION_RETENTION_DAYS + 1)),
+        "old_unread": models.Notification(user_id=0, message="archive probe", is_read=False,
+                                          created_at=now - timedelta(days=jobs.NOTIFICATION_RETENTION_DAYS + 1)),
+        "recent_read": models.Notification(user_id=0, message="archive probe", is_read=True, created_at=now),
+    }
+    broadcasts = {
+        "old": models.BroadcastNotification(role="Probe", message="archive probe",
+                                            created_at=now - timedelta(days=jobs.NOTIFICATION_BROADCAST_RETENTION_DAYS + 1)),
+        "recent": models.BroadcastNotification(role="Probe", message="archive probe", created_at=now),
+    }
+    try:
+        with Session(database.engine) as session:
+            session.add_all([*rows.values(), *broadcasts.values()])
+            session.commit()
+            ids = {name: row.id for name, row in rows.items()}
+            broadcast_ids = {name: row.id for name, row in broadcasts.items()}
+            user_id = session.exec(select(models.User.id)).first()
+            if user_id is not None:
+                session.add(models.BroadcastReceipt(broadcast_id=broadcast_ids["old"], user_id=user_id))
+                session.commit()
+    except OperationalError:
+        pytest.skip("database not reachable")
+
+    try:
+        with Session(database.engine) as session:
+            jobs.notification_archive(session)
+            archived = session.get(models.NotificationArchive, ids["old_read"])
+            assert archived is not None and archived.is_read and archived.message == "archive probe"
+            assert session.get(models.Notification, ids["old_read"]) is None
+            assert session.get(models.Notification, ids["recent_read"]) is not None
+            if jobs.NOTIFICATION_UNREAD_RETENTION_DAYS == 0 or jobs.NOTIFICATION_UNREAD_RETENTION_DAYS > jobs.NOTIFICATION_RETENTION_DAYS + 1:
+                assert session.get(models.Notification, ids["old_unread"]) is not None, "Unread notification archived early."
+            if jobs.NOTIFICATION_BROADCAST_RETENTION_DAYS:
+                archived = session.get(models.BroadcastNotificationArchive, broadcast_ids["old"])
+                assert archived is not None and archived.role == "Probe" and archived.message == "archive probe"
+                assert session.get(models.BroadcastNotification, broadcast_ids["old"]) is None
+                assert not session.exec(select(models.BroadcastReceipt)
+                                        .where(models.BroadcastReceipt.broadcast_id == broadcast_ids["old"])).all()
+                assert session.get(models.BroadcastNotification, broadcast_ids["recent"]) is not None
+    finally:
+        with Session(database.engine) as session:
+            for model, keys in ((models.Notification, ids), (models.NotificationArchive, ids),
+                                (models.BroadcastNotification, broadcast_ids), (models.BroadcastNotificationArchive, broadcast_ids)):
+                for row_id in keys.values():
+                    row = session.get(model, row_id)
+                    if row is not None:
+                        session.delete(row)
+            session.commit()
+
+def test_notification_outbox_dispatch():
+    # Enqueued notifications are written once, whether this dispatch or a running server's moves them
+    import time
+    from sqlmodel import Session, select
+    import database, models, notify, notification_outbox
+    message = f"outbox probe {time.time()}"
+    try:
+        with Session(database.engine) as session:
+            notify.notify_users(session, [(0, message), (0, message)])
+            notify.notify_role(session, "Probe", message)
+            session.commit()
+    except OperationalError:
+        pytest.skip("database not reachable")
+
+    try:
+        with Session(database.engine) as session:
+            notification_outbox.dispatch(session)
+            pending = select(models.NotificationOutbox.id).where(models.NotificationOutbox.message == message)
+            deadline = time.monotonic() + 10
+            while session.exec(pending).first() and time.monotonic() < deadline:
+                time.sleep(0.1)
+            personal = session.exec(select(models.Notification).where(models.Notification.message == message)).all()
+            broadcast = session.exec(select(models.BroadcastNotification).where(models.BroadcastNotification.message == message)).all()
+            assert len(personal) == 2 and all(not row.is_read for row in personal)
+            assert [row.role for row in broadcast] == ["Probe"]
+    finally:
+        with Session(database.engine) as session:
+            for model in (models.NotificationOutbox, models.Notification, models.BroadcastNotification):
+                for row in session.exec(select(model).where(model.message == message)).all():
+                    session.delete(row)
+            session.commit()
+
+@pytest.mark.asyncio
+async def test_notification_outbox_metrics(librarian_access_token):
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.get(
+            '/metrics/notification_outbox',
+            headers={"Authorization": f"Bearer {await librarian_access_token}"}
+        )
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}. Response: {response.text}"
+    assert response.json()["running"] is True
+    assert response.json()["pending"] >= 0
+
+@pytest.mark.asyncio
+async def test_create_book_unknown_author_leaves_no_book(librarian_access_token):
+    # The request is one transaction: the 404 on the author rolls back the book as well
+    import time
+    token = await librarian_access_token
+    title = f"Orphan Probe {time.time()}"
+    async with AsyncClient(base_url=BASE_URL) as client:
+        response = await client.post(
+            '/book/create_book',
+            json={"title": title, "total_copies": 1, "author_pen_names": ["No Such Pen Name"]},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 404, f"Expected 404 but got {response.status_code}. Response: {response.text}"
+        search = await client.get('/book/search_books', params={'title': title})
+    assert search.status_code == 200, f"Expected 200 but got {search.status_code}. Response: {search.text}"
+    assert search.json() == [], "The rejected book was still created."
+
+@pytest.mark.asyncio
+async def test_search_books_counts_follow_loan_approval(access_token, librarian_access_token):
+    # Search pages are cached; approving a loan must invalidate them, not wait out the TTL
+    import re, time
+    member = {"Authorization": f"Bearer {await access_token}"}
+    librarian = {"Authorization": f"Bearer {await librarian_access_token}"}
+    title = f"Cache Probe {time.time()}"
+    async with AsyncClient(base_url=BASE_URL) as client:
+        created = await client.post('/book/create_book', json={"title": title, "total_copies": 1}, headers=librarian)
+        assert created.status_code == 200, f"Expected 200 but got {created.status_code}. Response: {created.text}"
+        book_id = created.json()["id"]
+        try:
+            before = (await client.get('/book/search_books', params={'title': title})).json()[0]
+            assert (before["copies_available"], before["copies_on_rent"], before["next_available_on"]) == (1, 0, None)
+
+            loan = await client.post('/loan/User/create_loan', params={'rent_title': title}, headers=member)
+            assert loan.status_code == 200, f"Expected 200 but got {loan.status_code}. Response: {loan.text}"
+            loan_id = int(re.search(r"ID: (\d+)", loan.json()["message"]).group(1))
+            approved = await client.post('/loan/librarian/approve_loan', json={"loan_id": loan_id}, headers=librarian)
+            assert approved.status_code == 200, f"Expected 200 but got {approved.status_code}. Response: {approved.text}"
+
+            after = (await client.get('/book/search_books', params={'title': title})).json()[0]
+            assert (after["copies_available"], after["copies_on_rent"]) == (0, 1), "Search served the counts cached before the approval."
+            assert after["next_available_on"] is not None
+
+            await client.post('/loan/librarian/return_book', json={"loan_id": loan_id}, headers=librarian)
+            returned = (await client.get('/book/search_books', params={'title': title})).json()[0]
+            assert (returned["copies_available"], returned["copies_on_rent"], returned["next_available_on"]) == (1, 0, None)
+        finally:
+            await client.delete(f'/book/delete_book/{book_id}', headers=librarian)